@@ -0,0 +1,185 @@
+"""
+Throughput benchmarks of the providers against the local stand-in server.
+
+For every provider, page size and concurrency level, pages a search for a fixed number of
+pages through `Provider.iter_pages`, reporting pages/s and publications/s, the time to parse
+a page (`_build_results_page` on a served body, without the network) and the peak memory
+traced while paging. Concurrency is the provider prefetch and `RateLimit.max_concurrent`, the
+rate limit itself being lifted so the server latency is the only wait.
+
+    python benchmarks/bench_providers.py --page-size 25 --page-size 100 -c 1 -c 4
+"""
+
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from fixture_server import redirects, start
+from loguru import logger
+from rich import print
+from rich.table import Table
+
+from pysota.core import HttpTransport, Provider, RateLimit
+from pysota.core.response_cache import build_response
+from pysota.services.arxiv import ArxivProvider
+from pysota.services.crossref import CrossrefProvider
+from pysota.services.semantic_scholar import SemanticScholarProvider
+
+PROVIDERS: dict[str, type[Provider]] = {
+    'arxiv': ArxivProvider,
+    'crossref': CrossrefProvider,
+    'semantic': SemanticScholarProvider,
+}
+
+
+def make_provider(name: str, concurrency: int, port: int) -> Provider:
+    provider = PROVIDERS[name](
+        prefetch=concurrency,
+        rate_limit=RateLimit(rate=10_000, burst=10_000, max_concurrent=concurrency),
+        max_depth=None,
+    )
+    provider.transport = HttpTransport(
+        redirects=redirects(port), pool_maxsize=max(concurrency, 8), retries=5
+    )
+    return provider
+
+
+def run_pages(provider: Provider, page_size: int, pages: int) -> tuple[int, int]:
+    query = provider.make_query('bench', ['neural networks'], [], page_size, 0)
+    done = items = 0
+    for page in provider.iter_pages(query):
+        done += 1
+        items += len(page.items)
+        if done >= pages:
+            break
+    return done, items
+
+
+def parse_time(provider: Provider, page_size: int, repeat: int) -> float:
+    """Mean seconds to build a page from a body already received."""
+    query = provider.make_query('bench', ['neural networks'], [], page_size, 0)
+    url = query.generate_url()
+    # through the provider, whose retries get past the 429 and 503 the server may answer
+    served = provider.fetch(url)
+    headers = {'Content-Type': served.headers.get('Content-Type', '')}
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        response = build_response(url, 200, headers, served.content)
+        provider._build_results_page(response, query)
+    return (time.perf_counter() - start_time) / repeat
+
+
+def bench(name: str, page_size: int, concurrency: int, pages: int, port: int) -> dict:
+    provider = make_provider(name, concurrency, port)
+    start_time = time.perf_counter()
+    done, items = run_pages(provider, page_size, pages)
+    elapsed = time.perf_counter() - start_time
+
+    parse = parse_time(provider, page_size, repeat=5)
+
+    # a second pass, traced: tracemalloc slows the first one down too much to time it
+    provider = make_provider(name, concurrency, port)
+    tracemalloc.start()
+    run_pages(provider, page_size, pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'provider': name,
+        'page_size': page_size,
+        'concurrency': concurrency,
+        'pages': done,
+        'items': items,
+        'seconds': elapsed,
+        'pages_per_s': done / elapsed,
+        'items_per_s': items / elapsed,
+        'parse_ms': parse * 1000,
+        'peak_mb': peak / 2**20,
+    }
+
+
+def main(
+    providers: Annotated[
+        list[str] | None,
+        typer.Option('--provider', '-p', help='Providers to benchmark, all by default'),
+    ] = None,
+    page_sizes: Annotated[
+        list[int] | None,
+        typer.Option('--page-size', '-s', help='Page sizes, 25 and 100 by default'),
+    ] = None,
+    concurrency: Annotated[
+        list[int] | None,
+        typer.Option('--concurrency', '-c', help='Concurrency levels, 1 and 4 by default'),
+    ] = None,
+    pages: Annotated[int, typer.Option(help='Pages per run')] = 20,
+    latency: Annotated[float, typer.Option(help='Server latency per answer, seconds')] = 0.05,
+    jitter: Annotated[float, typer.Option()] = 0.0,
+    error_rate: Annotated[float, typer.Option()] = 0.0,
+    throttle_rate: Annotated[float, typer.Option()] = 0.0,
+    recorded: Annotated[
+        Path | None, typer.Option(help='Payload archive folder to serve instead')
+    ] = None,
+    output: Annotated[Path | None, typer.Option(help='Write the results as JSON')] = None,
+):
+    providers = providers or list(PROVIDERS)
+    page_sizes = page_sizes or [25, 100]
+    concurrency = concurrency or [1, 4]
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    server, port = start(
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        recorded=recorded,
+    )
+    results = []
+    try:
+        for name in providers:
+            for page_size in page_sizes:
+                for workers in concurrency:
+                    # providers print every page they parse
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        result = bench(name, page_size, workers, pages, port)
+                    results.append(result)
+                    print(
+                        f'[cyan]{name}[/cyan] size {page_size} x{workers}: '
+                        f'{result["pages_per_s"]:.1f} pages/s'
+                    )
+    finally:
+        server.terminate()
+
+    table = Table(title=f'Provider throughput, {latency * 1000:.0f} ms server latency')
+    for column in (
+        'provider',
+        'page size',
+        'concurrency',
+        'pages/s',
+        'pubs/s',
+        'parse ms',
+        'peak MB',
+    ):
+        table.add_column(column, justify='left' if column == 'provider' else 'right')
+    for r in results:
+        table.add_row(
+            r['provider'],
+            str(r['page_size']),
+            str(r['concurrency']),
+            f'{r["pages_per_s"]:.1f}',
+            f'{r["items_per_s"]:.0f}',
+            f'{r["parse_ms"]:.2f}',
+            f'{r["peak_mb"]:.1f}',
+        )
+    print(table)
+    if output is not None:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -0,0 +1,284 @@
+"""
+Local stand-in for the arXiv, Crossref and Semantic Scholar APIs.
+
+Serves pages in the format of each API, so the providers of `pysota.services` can be run and
+benchmarked reproducibly without the network. Pages are generated (deterministic titles,
+authors and abstracts, numbered from the requested offset or cursor), or replayed from the
+responses recorded in a payload archive (`pysota search --archive`) with `--recorded`.
+Latency, 5xx errors and 429 answers can be injected to exercise the retry and rate limiting
+paths.
+
+Point the providers at it with the transport redirects of `redirects(port)`:
+
+    python benchmarks/fixture_server.py --port 8800 --latency 0.05 --throttle-rate 0.02
+"""
+
+import gzip
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Annotated, ClassVar
+from urllib.parse import parse_qs, urlparse
+
+import typer
+
+# URL prefix of every API, by route of the stand-in server
+APIS = {
+    'arxiv': 'http://export.arxiv.org/api',
+    'crossref': 'https://api.crossref.org',
+    'semantic': 'https://api.semanticscholar.org',
+}
+HOSTS = {urlparse(prefix).netloc: route for route, prefix in APIS.items()}
+WORDS = [
+    'learning', 'neural', 'network', 'model', 'data', 'method', 'approach', 'results',
+    'analysis', 'performance', 'training', 'system', 'framework', 'language', 'graph',
+    'detection', 'optimization', 'transformer', 'deep', 'representation', 'evaluation',
+    'benchmark', 'inference', 'retrieval', 'generation', 'robust', 'efficient',
+]  # fmt: skip
+
+
+def redirects(port: int, host: str = '127.0.0.1') -> dict[str, str]:
+    """`HttpTransport.redirects` sending the providers to a stand-in server on `port`."""
+    return {prefix: f'http://{host}:{port}/{route}' for route, prefix in APIS.items()}
+
+
+class Paper:
+    """Deterministic fake paper, the same for a given index on every run."""
+
+    def __init__(self, index: int):
+        rng = random.Random(index)
+        self.index = index
+        self.title = ' '.join(rng.choices(WORDS, k=8)).capitalize() + f' {index}'
+        self.authors = [f'Author {rng.randrange(10_000)}' for _ in range(rng.randint(1, 6))]
+        self.abstract = ' '.join(rng.choices(WORDS, k=rng.randint(120, 250))).capitalize() + '.'
+        self.year = rng.randint(2000, 2025)
+        self.date = f'{self.year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        self.doi = f'10.5555/bench.{index}'
+
+
+def arxiv_page(start: int, size: int, total: int) -> tuple[str, bytes]:
+    entries = []
+    for index in range(start, min(start + size, total)):
+        paper = Paper(index)
+        authors = ''.join(f'<author><name>{a}</name></author>' for a in paper.authors)
+        entries.append(
+            f'<entry><id>http://arxiv.org/abs/{index}</id><title>{paper.title}</title>'
+            f'<summary>{paper.abstract}</summary><published>{paper.date}T00:00:00Z</published>'
+            f'{authors}<arxiv:doi>{paper.doi}</arxiv:doi></entry>'
+        )
+    feed = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom" '
+        'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" '
+        'xmlns:arxiv="http://arxiv.org/schemas/atom">'
+        f'<opensearch:totalResults>{total}</opensearch:totalResults>'
+        f'<opensearch:startIndex>{start}</opensearch:startIndex>'
+        f'<opensearch:itemsPerPage>{size}</opensearch:itemsPerPage>'
+        f'{"".join(entries)}</feed>'
+    )
+    return 'application/atom+xml', feed.encode()
+
+
+def crossref_page(start: int, size: int, total: int, cursor: bool) -> tuple[str, bytes]:
+    items = []
+    for index in range(start, min(start + size, total)):
+        paper = Paper(index)
+        year, month, day = (int(part) for part in paper.date.split('-'))
+        items.append(
+            {
+                'DOI': paper.doi,
+                'title': [paper.title],
+                'author': [{'given': a.split()[0], 'family': a.split()[1]} for a in paper.authors],
+                'abstract': f'<jats:p>{paper.abstract}</jats:p>',
+                'published': {'date-parts': [[year, month, day]]},
+            }
+        )
+    message = {'total-results': total, 'items-per-page': size, 'items': items}
+    if cursor:
+        message['next-cursor'] = f'bench-{start + size}'
+    return 'application/json', json.dumps({'status': 'ok', 'message': message}).encode()
+
+
+def semantic_page(start: int, size: int, total: int, bulk: bool) -> tuple[str, bytes]:
+    data = []
+    for index in range(start, min(start + size, total)):
+        paper = Paper(index)
+        data.append(
+            {
+                'paperId': f'{index:040x}',
+                'title': paper.title,
+                'abstract': paper.abstract,
+                'year': paper.year,
+                'publicationDate': paper.date,
+                'authors': [{'authorId': str(i), 'name': a} for i, a in enumerate(paper.authors)],
+                'externalIds': {'DOI': paper.doi},
+            }
+        )
+    payload: dict = {'total': total, 'data': data}
+    if bulk:
+        payload['token'] = str(start + size) if start + size < total else None
+    else:
+        payload['offset'] = start
+        if start + size < total:
+            payload['next'] = start + size
+    return 'application/json', json.dumps(payload).encode()
+
+
+def load_recorded(folder: Path) -> dict[str, list[tuple[str, bytes]]]:
+    """Bodies of the archived responses by route, in the `PayloadArchive` format."""
+    recorded: dict[str, list[tuple[str, bytes]]] = {route: [] for route in APIS}
+    for path in sorted(folder.glob('*/*/*.gz')):
+        with gzip.open(path, 'rb') as f:
+            meta = json.loads(f.readline())
+            body = f.read()
+        route = HOSTS.get(urlparse(meta['url']).netloc)
+        if route is not None:
+            content_type = meta['headers'].get('Content-Type', 'application/json')
+            recorded[route].append((content_type, body))
+    return recorded
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # set on the server class by `serve`
+    total: int = 100_000
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    recorded: ClassVar[dict[str, itertools.cycle]] = {}
+
+    _rng = random.Random(0)
+    _rng_lock = threading.Lock()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _roll(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _send(self, status: int, content_type: str = '', body: bytes = b'', **headers) -> None:
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in headers.items():
+            self.send_header(name.replace('_', '-'), value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, route: str, path: str, params: dict[str, str]) -> tuple[str, bytes] | None:
+        if route in self.recorded:
+            return next(self.recorded[route])
+        if route == 'arxiv':
+            start, size = int(params.get('start', 0)), int(params.get('max_results', 10))
+            return arxiv_page(start, size, self.total)
+        if route == 'crossref':
+            cursor = params.get('cursor')
+            if cursor is not None:
+                start = 0 if cursor == '*' else int(cursor.removeprefix('bench-'))
+            else:
+                start = int(params.get('offset', 0))
+            return crossref_page(start, int(params.get('rows', 20)), self.total, cursor is not None)
+        if route == 'semantic':
+            bulk = path.endswith('/bulk')
+            if bulk:
+                start, size = int(params.get('token') or 0), 1000
+            else:
+                start, size = int(params.get('offset', 0)), int(params.get('limit', 10))
+            return semantic_page(start, size, self.total, bulk)
+        return None
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        route = url.path.strip('/').split('/', 1)[0]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.latency or self.jitter:
+            time.sleep(max(self.latency + self._roll() * self.jitter, 0))
+        if self._roll() < self.throttle_rate:
+            self._send(429, Retry_After='1')
+            return
+        if self._roll() < self.error_rate:
+            self._send(503)
+            return
+        page = self._page(route, url.path, params)
+        if page is None:
+            self._send(404)
+            return
+        self._send(200, *page)
+
+
+def serve(
+    port: int,
+    total: int = 100_000,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    recorded: Path | None = None,
+) -> None:
+    handler = type(
+        'Handler',
+        (FixtureHandler,),
+        {
+            'total': total,
+            'latency': latency,
+            'jitter': jitter,
+            'error_rate': error_rate,
+            'throttle_rate': throttle_rate,
+            'recorded': {
+                route: itertools.cycle(bodies)
+                for route, bodies in (load_recorded(recorded) if recorded else {}).items()
+                if bodies
+            },
+        },
+    )
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(**options) -> tuple[multiprocessing.Process, int]:
+    """Run a stand-in server in a child process, returning it once it accepts connections."""
+    port = options.pop('port', None) or free_port()
+    process = multiprocessing.Process(target=serve, args=(port,), kwargs=options, daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f'The fixture server did not start on port {port}')
+
+
+def main(
+    port: Annotated[int, typer.Option()] = 8800,
+    total: Annotated[int, typer.Option(help='Results of every generated search')] = 100_000,
+    latency: Annotated[float, typer.Option(help='Seconds added to every answer')] = 0.0,
+    jitter: Annotated[float, typer.Option(help='Random extra seconds, up to')] = 0.0,
+    error_rate: Annotated[float, typer.Option(help='Share of 503 answers')] = 0.0,
+    throttle_rate: Annotated[float, typer.Option(help='Share of 429 answers')] = 0.0,
+    recorded: Annotated[
+        Path | None, typer.Option(help='Payload archive folder to replay instead')
+    ] = None,
+):
+    print(f'Serving on http://127.0.0.1:{port}, redirects: {redirects(port)}')
+    serve(port, total, latency, jitter, error_rate, throttle_rate, recorded)
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -1,16 +1,23 @@
+import time
 from pathlib import Path
 from typing import Annotated
 
 from loguru import logger
 from rich import print
-from typer import Option, Typer
+from typer import Argument, BadParameter, Option, Typer
 
-from pysota.core import Persistence
+from pysota.core import Persistence, SqliteStorage
 from pysota.process import Cleaner
 
 app = Typer(no_args_is_help=True, invoke_without_command=True)
 
 
+def _check_format(format: str) -> str:
+    if format not in Persistence.backends:
+        raise BadParameter(f'Unknown format {format}, choose from {list(Persistence.backends)}')
+    return format
+
+
 @app.command(help='Build a database  from a query results')
 def db_build(
     query: Annotated[str, Option('--query', '-q', help='Query name')],
@@ -20,6 +27,15 @@ def db_build(
     name: Annotated[
         str, Option('--name', help='Folder to store the DB. Defaults to query name')
     ] = '',
+    format: Annotated[
+        str,
+        Option(
+            '--format',
+            '-f',
+            help=f'Storage format: {", ".join(Persistence.backends)}',
+            callback=_check_format,
+        ),
+    ] = 'yaml',
 ):
     db = Persistence.load_files(path=results_dir, query_name=query)
     logger.info(f'Filling database with {len(db)} total results')
@@ -37,6 +53,52 @@ def db_build(
         name = query
 
     db_path = results_dir.joinpath('../db').joinpath(name)
-    Persistence.save_files(db, db_path)
+    Persistence.save_files(db, db_path, format)
     logger.info(f'Saved database to {db_path}')
     print(f'Saved database to {db_path}')
+
+
+@app.command(help='Convert a database to another storage format, e.g. to or from YAML')
+def db_convert(
+    source: Annotated[Path, Argument(help='Folder of the DB to convert')],
+    target: Annotated[Path, Argument(help='Folder to store the converted DB')],
+    format: Annotated[
+        str,
+        Option(
+            '--format',
+            '-f',
+            help=f'Storage format: {", ".join(Persistence.backends)}',
+            callback=_check_format,
+        ),
+    ] = 'parquet',
+):
+    db = Persistence.load_files(source)
+    Persistence.save_files(db, target, format)
+    logger.info(f'Converted {len(db)} publications from {source} to {format} in {target}')
+    print(f'Converted [bold]{len(db)}[/bold] publications to {format} in {target}')
+
+
+@app.command(help='Full-text search of a SQLite database (db-build --format sqlite)')
+def db_query(
+    text: Annotated[str, Argument(help='Words to look for in the titles and abstracts')],
+    db: Annotated[Path, Option('--db', help='Folder of the DB to search')],
+    k: Annotated[int, Option('-k', '--top', help='Number of results')] = 10,
+    provider: Annotated[str | None, Option('-p', '--provider', help='Only this provider')] = None,
+    since: Annotated[int | None, Option('--since', help='Only from this year on')] = None,
+    until: Annotated[int | None, Option('--until', help='Only up to this year')] = None,
+    raw: Annotated[
+        bool, Option('--raw', help='TEXT is an FTS5 query: OR, NOT, "phrases", prefix*')
+    ] = False,
+):
+    storage = SqliteStorage()
+    if not storage.holds(db):
+        print(f'No SQLite database in [red]{db}[/red], see db-build/db-convert --format sqlite')
+        return
+    start = time.perf_counter()
+    found = storage.search(db, text, k, provider, since, until, raw)
+    elapsed = (time.perf_counter() - start) * 1000
+    logger.info(f'Query {text!r} on {db}: {len(found)} results in {elapsed:.1f} ms')
+    for pub, score in found:
+        print(f'[bold]{score:6.2f}[/bold] {pub.year} [cyan]{pub.provider_name}[/cyan] {pub.id}')
+        print(f'       {pub.title}')
+    print(f'{len(found)} results in {elapsed:.1f} ms')
@@ -1,3 +1,4 @@
+import time
 from pathlib import Path
 from typing import Annotated, List
 
@@ -13,8 +14,24 @@ from rich.progress import (
     TimeRemainingColumn,
 )
 
-from pysota.core import ResultPage
-from pysota.services import ArxivProvider, CrossrefProvider, SearchEngine, SemanticScholarProvider
+from pysota.core import (
+    AbstractEnricher,
+    PayloadArchive,
+    Provider,
+    QueryManifest,
+    ResponseCache,
+    ResultPage,
+)
+from pysota.services import (
+    ArxivProvider,
+    CrossrefProvider,
+    DOAJProvider,
+    EuropePMCProvider,
+    OpenAlexProvider,
+    PubMedProvider,
+    SearchEngine,
+    SemanticScholarProvider,
+)
 
 app = typer.Typer(no_args_is_help=True, invoke_without_command=True)
 
@@ -28,16 +45,33 @@ progress = Progress(
     TimeRemainingColumn(compact=True, elapsed_when_finished=True),
 )
 
+# providers that can be selected with --provider, by name
+PROVIDERS: dict[str, type[Provider]] = {
+    'arxiv': ArxivProvider,
+    'crossref': CrossrefProvider,
+    'semantic': SemanticScholarProvider,
+    'pubmed': PubMedProvider,
+    'openalex': OpenAlexProvider,
+    'doaj': DOAJProvider,
+    'epmc': EuropePMCProvider,
+}
+DEFAULT_PROVIDERS = ['arxiv', 'crossref', 'semantic']
+
 engine = SearchEngine(
     verbose=True,
-    providers=[
-        ArxivProvider(),
-        CrossrefProvider(),
-        SemanticScholarProvider(),
-    ],
+    providers=[PROVIDERS[name]() for name in DEFAULT_PROVIDERS],
 )
 
 
+def _enricher() -> AbstractEnricher:
+    """Abstract lookups through the engine providers, so both share one rate limiter per API."""
+    lookups = []
+    for kind in (SemanticScholarProvider, OpenAlexProvider):
+        same = (provider for provider in engine.providers if isinstance(provider, kind))
+        lookups.append(next(same, None) or kind())
+    return AbstractEnricher(providers=lookups)
+
+
 @app.command(help='Use the subscribed clients to search a query')
 def search(
     include: Annotated[List[str], typer.Argument()],
@@ -48,11 +82,106 @@ def search(
     num_items: Annotated[int, typer.Option('--num-items', '-n')] = 10,
     offset: Annotated[int, typer.Option()] = 0,
     all: Annotated[bool, typer.Option()] = False,
+    providers: Annotated[
+        list[str],
+        typer.Option('--provider', '-p', help=f'Providers to query: {", ".join(PROVIDERS)}'),
+    ] = DEFAULT_PROVIDERS,
+    concurrent: Annotated[
+        bool, typer.Option('--concurrent', '-c', help='Query all providers at once')
+    ] = False,
+    stream: Annotated[
+        bool, typer.Option(help='With --all --save, persist every page as it is downloaded')
+    ] = True,
+    resume: Annotated[
+        bool, typer.Option(help='Resume a streamed harvest from its checkpoint')
+    ] = True,
+    delta: Annotated[
+        bool,
+        typer.Option(help='Only harvest publications newer than the previous run and merge them'),
+    ] = False,
+    shard: Annotated[
+        bool,
+        typer.Option(help='Split queries too large to page through into date ranges'),
+    ] = False,
+    enrich: Annotated[
+        bool,
+        typer.Option(help='Backfill missing abstracts from Semantic Scholar and OpenAlex on save'),
+    ] = False,
+    deadline: Annotated[
+        float | None,
+        typer.Option(help='Seconds the search may take, slower providers are cut short'),
+    ] = None,
+    timeout: Annotated[
+        float | None, typer.Option(help='Seconds a single provider may take')
+    ] = None,
+    hedge_after: Annotated[
+        float | None,
+        typer.Option(help='Seconds after which an unanswered request is sent again'),
+    ] = None,
+    budget: Annotated[
+        int | None,
+        typer.Option(help='Requests to spend overall, favouring providers bringing new results'),
+    ] = None,
+    cache: Annotated[bool, typer.Option(help='Cache provider responses on disk')] = False,
+    offline: Annotated[bool, typer.Option(help='Serve responses only from the cache')] = False,
+    cache_dir: Annotated[Path, typer.Option('--cache-dir')] = Path('./results/cache'),
+    cache_ttl: Annotated[float, typer.Option('--cache-ttl', help='Cache lifetime in hours')] = 168,
+    archive: Annotated[
+        bool, typer.Option(help='Archive the raw responses, to be replayed later')
+    ] = False,
+    archive_dir: Annotated[Path, typer.Option('--archive-dir')] = Path('./results/archive'),
 ):
+    unknown = [name for name in providers if name.lower() not in PROVIDERS]
+    if unknown:
+        raise typer.BadParameter(f'Unknown providers {unknown}, choose from {list(PROVIDERS)}')
+    if [name.lower() for name in providers] != DEFAULT_PROVIDERS:
+        engine.use_providers([PROVIDERS[name.lower()]() for name in providers])
+    engine.concurrent = concurrent
+    engine.deadline = deadline
+    for provider in engine.providers:
+        provider.timeout = timeout
+        provider.hedge_after = hedge_after
+    if enrich:
+        engine.use_enricher(_enricher())
+    if cache or offline:
+        engine.use_cache(ResponseCache(folder=cache_dir, ttl=cache_ttl * 3600, offline=offline))
+    if archive:
+        engine.use_archive(PayloadArchive(folder=archive_dir))
     print(f'[bold]Searching for : [/bold][i green]\n{include=}\n{exclude=}[/i green]')
     logger.info(f'Searching for : {include=} - {exclude=}')
     total = len(engine.providers) * 2 if save else len(engine.providers)
 
+    if budget is not None:
+        with progress:
+            task_id = progress.add_task('Searching ...', total=budget)
+            results = engine.search_budget(
+                name, include, exclude, num_items, offset, budget, task_id, progress
+            )
+        if save and results_dir:
+            print(f'\n>[bold]Saving results to [/bold][i green]{results_dir}[/i green]')
+            logger.info(f'Saving results to {results_dir}')
+            for provider, result in results.items():
+                result.save(Path(results_dir).joinpath(name).joinpath(provider), engine.enrich)
+        return
+
+    if save and (delta or shard or (stream and all)):
+        with progress:
+            task_id = progress.add_task('Harvesting ...', total=len(engine.providers))
+            engine.harvest(
+                name=name,
+                include=include,
+                exclude=exclude,
+                num_items=num_items,
+                offset=offset,
+                results_dir=results_dir,
+                task_id=task_id,
+                progress=progress,
+                resume=resume,
+                delta=delta,
+                shard=shard,
+            )
+        return
+
     with progress:
         task_id = progress.add_task('Searching ...', total=total)
         # fmt: off
@@ -72,9 +201,146 @@ def search(
             logger.info(f'Saving results to {results_dir}')
 
             for provider, result in results.items():
-                result.save(Path(results_dir).joinpath(name).joinpath(provider))
+                if result.partial:
+                    print(f'[yellow]Warning:[/yellow] {provider} results are partial')
+                result.save(Path(results_dir).joinpath(name).joinpath(provider), engine.enrich)
                 progress.advance(task_id)
 
 
+@app.command(help='Search every query of a YAML manifest at once')
+def search_batch(
+    manifest: Annotated[Path, typer.Argument(help='YAML file listing the queries')],
+    save: Annotated[bool, typer.Option('--save', '-s')] = False,
+    results_dir: Annotated[Path, typer.Option('--dir')] = Path('./results/raw'),
+    workers: Annotated[
+        int | None,
+        typer.Option(help='Searches in flight at once, across every query and provider'),
+    ] = None,
+    enrich: Annotated[
+        bool,
+        typer.Option(help='Backfill missing abstracts from Semantic Scholar and OpenAlex on save'),
+    ] = False,
+    cache: Annotated[bool, typer.Option(help='Cache provider responses on disk')] = False,
+    offline: Annotated[bool, typer.Option(help='Serve responses only from the cache')] = False,
+    cache_dir: Annotated[Path, typer.Option('--cache-dir')] = Path('./results/cache'),
+    cache_ttl: Annotated[float, typer.Option('--cache-ttl', help='Cache lifetime in hours')] = 168,
+    archive: Annotated[
+        bool, typer.Option(help='Archive the raw responses, to be replayed later')
+    ] = False,
+    archive_dir: Annotated[Path, typer.Option('--archive-dir')] = Path('./results/archive'),
+):
+    try:
+        queries = QueryManifest.load(manifest).queries
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(f'Cannot read manifest {manifest}: {e}')
+
+    # one provider instance per name, so every query shares its rate limiter
+    wanted = {name.lower() for query in queries for name in query.providers or DEFAULT_PROVIDERS}
+    unknown = sorted(wanted - set(PROVIDERS))
+    if unknown:
+        raise typer.BadParameter(f'Unknown providers {unknown}, choose from {list(PROVIDERS)}')
+    instances = {name: PROVIDERS[name]() for name in PROVIDERS if name in wanted}
+    for query in queries:
+        names = query.providers or DEFAULT_PROVIDERS
+        query.providers = [instances[name.lower()].name for name in names]
+    engine.use_providers(list(instances.values()))
+    engine.max_workers = workers
+    if enrich:
+        engine.use_enricher(_enricher())
+    if cache or offline:
+        engine.use_cache(ResponseCache(folder=cache_dir, ttl=cache_ttl * 3600, offline=offline))
+    if archive:
+        engine.use_archive(PayloadArchive(folder=archive_dir))
+    print(f'[bold]Searching {len(queries)} queries from [/bold][i green]{manifest}[/i green]')
+    logger.info(f'Batch search of {len(queries)} queries from {manifest}')
+
+    with progress:
+        task_id = progress.add_task('Searching ...', total=None)
+        results, stats = engine.search_batch(queries, task_id, progress)
+        stats.report()
+        if save and results_dir:
+            print(f'\n>[bold]Saving results to [/bold][i green]{results_dir}[/i green]')
+            logger.info(f'Saving results to {results_dir}')
+            for query_name, pages in results.items():
+                for provider, result in pages.items():
+                    path = Path(results_dir).joinpath(query_name).joinpath(provider)
+                    result.save(path, engine.enrich)
+
+
+@app.command(help='Poll the providers for new publications of a query on a schedule')
+def watch(
+    include: Annotated[list[str], typer.Argument()],
+    name: Annotated[str, typer.Option()],
+    exclude: Annotated[list[str] | None, typer.Option('--exclude', '-x')] = None,
+    results_dir: Annotated[Path, typer.Option('--dir')] = Path('./results/raw'),
+    providers: Annotated[
+        list[str],
+        typer.Option('--provider', '-p', help=f'Providers to query: {", ".join(PROVIDERS)}'),
+    ] = DEFAULT_PROVIDERS,
+    interval: Annotated[float, typer.Option(help='Minutes between two polls')] = 60,
+    runs: Annotated[int, typer.Option(help='Number of polls, 0 to poll until stopped')] = 0,
+    cache_dir: Annotated[Path, typer.Option('--cache-dir')] = Path('./results/cache'),
+):
+    exclude = exclude or []
+    unknown = [name for name in providers if name.lower() not in PROVIDERS]
+    if unknown:
+        raise typer.BadParameter(f'Unknown providers {unknown}, choose from {list(PROVIDERS)}')
+    engine.use_providers([PROVIDERS[name.lower()]() for name in providers])
+    # every poll revalidates the cached pages, unchanged ones cost a 304 and no body
+    cache = ResponseCache(folder=cache_dir, ttl=None, revalidate=True)
+    engine.use_cache(cache)
+    print(f'[bold]Watching : [/bold][i green]\n{include=}\n{exclude=}[/i green]')
+    logger.info(f'Watching : {include=} - {exclude=} every {interval} minutes')
+
+    run = 0
+    try:
+        while runs == 0 or run < runs:
+            run += 1
+            not_modified = cache.not_modified
+            with progress:
+                task_id = progress.add_task(f'Poll {run} ...', total=len(engine.providers))
+                # a delta harvest only asks for publications past the watermarks and merges
+                # the new ones, the checkpoints of the previous poll are started over
+                sinks = engine.harvest(
+                    name=name,
+                    include=include,
+                    exclude=exclude,
+                    num_items=100,
+                    offset=0,
+                    results_dir=results_dir,
+                    task_id=task_id,
+                    progress=progress,
+                    resume=False,
+                    delta=True,
+                )
+            new = sum(sink.saved for sink in sinks.values())
+            unchanged = cache.not_modified - not_modified
+            print(f'[bold]Poll {run}:[/bold] {new} new publications, {unchanged} pages unchanged')
+            logger.info(f'Poll {run}: {new} new publications, {unchanged} pages unchanged')
+            if runs == 0 or run < runs:
+                time.sleep(interval * 60)
+    except KeyboardInterrupt:
+        print(f'Stopped watching after {run} polls')
+
+
+@app.command(help='Rebuild the saved results from the archived responses, offline')
+def replay(
+    name: Annotated[
+        str | None, typer.Option(help='Only replay this query, all of them by default')
+    ] = None,
+    results_dir: Annotated[Path, typer.Option('--dir')] = Path('./results/raw'),
+    archive_dir: Annotated[Path, typer.Option('--archive-dir')] = Path('./results/archive'),
+    workers: Annotated[
+        int | None, typer.Option(help='Parsing processes, one per core by default')
+    ] = None,
+):
+    if not archive_dir.is_dir():
+        raise typer.BadParameter(f'No archive in {archive_dir}')
+    sinks = PayloadArchive(folder=archive_dir).replay(results_dir, name, workers)
+    saved = sum(sink.saved for sink in sinks)
+    print(f'\n[bold]Replayed[/bold] {saved} publications into {len(sinks)} folders')
+    logger.info(f'Replayed {saved} publications into {len(sinks)} folders')
+
+
 if __name__ == '__main__':
     app()
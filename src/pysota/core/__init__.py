@@ -3,25 +3,69 @@
 # make ruff lint ignore this file
 
 # The order of imports is important here.
-# The Provider class depends on the IQuery and Publication classes.
+# The Provider class depends on the HttpTransport, RateLimit, ResponseCache, CircuitBreaker,
+# IQuery and Publication classes.
+# The storage backends depend on the Publication class, Persistence on the storage backends.
 # The ResultPage class depends on the IQuery and Publication classes.
+# The PayloadArchive class depends on the ResultPage and ResultSink classes.
+# The Paginator class depends on the IQuery and ResultPage classes.
+# The QueryPlanner class depends on the IQuery class.
+# The AbstractEnricher class depends on the Provider and Publication classes.
+# The YieldScheduler class depends on the IQuery, Publication and ResultPage classes.
 # That is why the dependencies are imported first.
 
 # ruff: noqa
+from .transport import HttpTransport
+from .rate_limit import RateLimit, RateLimiter
+from .response_cache import CacheMissError, ResponseCache
+from .resilience import CircuitBreaker
+from .checkpoint import HarvestCheckpoint
+from .watermark import Watermarks
 from .query import IQuery
 from .publication import Publication
+from .storage import ParquetStorage, SqliteStorage, StorageBackend, YamlStorage
 from .persistence import Persistence
 from .cluster_container import ClustersContainer
 from .library import DocsLibrary
 from .result_page import ResultPage
+from .result_sink import ResultSink
+from .payload_archive import PayloadArchive
+from .paginator import Paginator
+from .query_planner import QueryPlanner
+from .batch import BatchQuery, BatchStats, QueryManifest
 from .provider import Provider
+from .enrichment import AbstractEnricher
+from .yield_scheduler import ProviderYield, YieldScheduler, YieldTracker
 
 __all__ = [
     'Provider',
+    'AbstractEnricher',
+    'ProviderYield',
+    'YieldScheduler',
+    'YieldTracker',
     'ResultPage',
+    'ResultSink',
+    'PayloadArchive',
+    'Paginator',
+    'QueryPlanner',
+    'BatchQuery',
+    'BatchStats',
+    'QueryManifest',
     'Publication',
     'DocsLibrary',
     'ClustersContainer',
     'IQuery',
     'Persistence',
+    'StorageBackend',
+    'YamlStorage',
+    'ParquetStorage',
+    'SqliteStorage',
+    'HttpTransport',
+    'RateLimit',
+    'RateLimiter',
+    'ResponseCache',
+    'CacheMissError',
+    'CircuitBreaker',
+    'HarvestCheckpoint',
+    'Watermarks',
 ]
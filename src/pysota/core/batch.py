@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import yaml
+from loguru import logger
+from pydantic import BaseModel, Field, model_validator
+from rich import print
+
+
+class BatchQuery(BaseModel):
+    """One query of a manifest; without `providers` every provider of the engine is searched."""
+
+    name: str
+    include: list[str]
+    exclude: list[str] = Field(default_factory=list)
+    num_items: int = Field(default=10, ge=1)
+    offset: int = Field(default=0, ge=0)
+    all: bool = False
+    providers: list[str] = Field(default_factory=list)
+
+
+class QueryManifest(BaseModel):
+    """
+    Queries searched together by `SearchEngine.search_batch`, read from a YAML file.
+
+    The fields under `defaults` apply to every query that leaves them out:
+
+        defaults:
+          num_items: 25
+          providers: [arxiv, crossref]
+        queries:
+          - name: llm-agents
+            include: [LLM agents, tool use]
+            exclude: [survey]
+          - name: rag
+            include: [retrieval augmented generation]
+            all: true
+    """
+
+    queries: list[BatchQuery]
+
+    @model_validator(mode='after')
+    def check_names(self) -> 'QueryManifest':
+        names = [query.name for query in self.queries]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f'Query names must be unique, repeated: {duplicates}')
+        return self
+
+    @classmethod
+    def load(cls, path: Path) -> 'QueryManifest':
+        with open(path, encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+        defaults = data.get('defaults') or {}
+        return cls(queries=[{**defaults, **query} for query in data.get('queries') or []])
+
+
+class BatchStats(BaseModel):
+    """Aggregate figures of a batch search."""
+
+    # query x provider pairs asked for
+    jobs: int = 0
+    # searches actually sent, identical requests of different queries are sent once
+    requests: int = 0
+    failed: int = 0
+    # searches of providers whose circuit breaker was open
+    skipped: int = 0
+    publications: int = 0
+    cache_hits: int = 0
+    elapsed: float = 0.0
+    per_provider: dict[str, int] = Field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        return self.publications / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self) -> None:
+        summary = (
+            f'{self.jobs} jobs, {self.requests} distinct searches '
+            f'({self.jobs - self.requests} deduplicated, {self.failed} failed, '
+            f'{self.skipped} skipped), {self.publications} publications in '
+            f'{self.elapsed:.1f}s ({self.throughput:.1f}/s, {self.cache_hits} cached pages)'
+        )
+        print(f'\n[bold]Batch:[/bold] {summary}')
+        logger.info(f'Batch: {summary}')
+        for provider_name, count in self.per_provider.items():
+            print(f'- [cyan]{provider_name}[/cyan]: {count} publications')
@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+from typing import ClassVar
+
+from loguru import logger
+from omegaconf import OmegaConf
+from pydantic import BaseModel, Field
+from rich import print
+
+
+class HarvestCheckpoint(BaseModel):
+    """
+    Progress of a provider harvest, stored next to its results.
+
+    The state file (`_checkpoint.yaml`) records the query it belongs to, the total announced by
+    the provider and the offsets of the pages already persisted. The ids of the saved
+    publications are appended to `_checkpoint.ids`, one per line, so recording a page does not
+    rewrite the whole set. A rerun loads both and only downloads the pages still missing.
+    Harvests paged by cursor also keep the cursor of the next page, so they resume from there.
+    """
+
+    folder: Path = Field(exclude=True)
+    query: str = ''
+    total: int = -1
+    done_offsets: list[int] = Field(default=[])
+    complete: bool = False
+    # cursor of the page after the last recorded one, for cursor paged harvests
+    cursor: str | None = None
+    saved_ids: set[str] = Field(default=set(), exclude=True)
+
+    STATE_FILE: ClassVar[str] = '_checkpoint.yaml'
+    IDS_FILE: ClassVar[str] = '_checkpoint.ids'
+
+    @property
+    def state_path(self) -> Path:
+        return self.folder.joinpath(self.STATE_FILE)
+
+    @property
+    def ids_path(self) -> Path:
+        return self.folder.joinpath(self.IDS_FILE)
+
+    @classmethod
+    def load(cls, folder: Path, query: str) -> 'HarvestCheckpoint':
+        """Load the checkpoint of `folder`, or a fresh one if missing or for another query."""
+        checkpoint = cls(folder=folder, query=query)
+        if not checkpoint.state_path.exists():
+            return checkpoint
+
+        state = OmegaConf.to_container(OmegaConf.load(checkpoint.state_path), resolve=True)
+        stored = cls(folder=folder, **state)  # type: ignore
+        if stored.query != query:
+            print(f'[yellow]Warning:[/yellow] ignoring checkpoint of another query in {folder}')
+            logger.warning(f'Ignoring checkpoint of {stored.query} in {folder}')
+            return checkpoint
+
+        if stored.ids_path.exists():
+            stored.saved_ids = set(stored.ids_path.read_text().split())
+        print(
+            f'Resuming from checkpoint: {len(stored.done_offsets)} pages, '
+            f'{len(stored.saved_ids)} publications already saved'
+        )
+        logger.info(f'Resuming {folder}: {len(stored.done_offsets)} pages done')
+        return stored
+
+    def is_done(self, offset: int) -> bool:
+        return offset in self.done_offsets
+
+    def record(
+        self, offset: int, total: int, saved_ids: list[str], cursor: str | None = None
+    ) -> None:
+        """Mark the page at `offset` as persisted along with the ids it saved."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if saved_ids:
+            with self.ids_path.open('a') as f:
+                f.write(''.join(f'{i}\n' for i in saved_ids))
+            self.saved_ids.update(saved_ids)
+        self.total = total
+        self.cursor = cursor
+        if offset not in self.done_offsets:
+            self.done_offsets.append(offset)
+        self.save()
+
+    def finish(self, offsets: list[int]) -> None:
+        """Mark the harvest complete if every one of `offsets` has been persisted."""
+        self.complete = all(self.is_done(offset) for offset in offsets)
+        self.save()
+
+    def save(self) -> None:
+        dump = OmegaConf.create(self.model_dump())
+        tmp = self.state_path.with_suffix('.tmp')
+        OmegaConf.save(dump, tmp)
+        os.replace(tmp, self.state_path)
+
+    def reset(self) -> None:
+        self.state_path.unlink(missing_ok=True)
+        self.ids_path.unlink(missing_ok=True)
+        self.total = -1
+        self.done_offsets = []
+        self.complete = False
+        self.cursor = None
+        self.saved_ids = set()
@@ -3,6 +3,7 @@ from pathlib import Path
 from pydantic import BaseModel
 
 from pysota.core.persistence import Persistence
+from pysota.core.storage import SqliteStorage
 
 
 class ClustersContainer(BaseModel):
@@ -29,9 +30,12 @@ class ClustersContainer(BaseModel):
         #         # publication.save(cluster_path)
         #         print(publication)
         print(f'> {clusters_output_path=}')
-        for pub_name, cluster_id in self.mapping.items():
+        publications = Persistence.load_files_by_name(source_db, list(self.mapping))
+        for (pub_name, cluster_id), publ in zip(self.mapping.items(), publications):
             cluster_path = clusters_output_path.joinpath(f'cluster_{cluster_id}')
             cluster_path.mkdir(parents=False, exist_ok=True)
-            publ = Persistence.load_file_by_name(source_db, pub_name)
             if publ:
                 publ.save(cluster_path)
+        backend = Persistence.backend(source_db)
+        if isinstance(backend, SqliteStorage):
+            backend.save_clusters(source_db, self.name, self.mapping)
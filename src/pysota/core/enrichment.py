@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from pysota.core import Provider, Publication
+
+
+class AbstractEnricher(BaseModel):
+    """
+    Backfills missing abstracts from the providers that can look publications up in bulk.
+
+    Publications whose abstract is too short to pass `Publication.check_validity` are
+    collected by DOI, or by title when they have none. Every provider with a bulk lookup
+    (`Provider.bulk_lookup`) is then asked for all of them at once, the providers
+    concurrently, skipping the publications it returned itself. The longest abstract found
+    replaces the missing one.
+    """
+
+    providers: list[Provider]
+    # abstracts up to this length are replaced, `check_validity` rejects them
+    min_length: int = Field(default=100, ge=0)
+
+    def missing(self, publications: list[Publication]) -> list[Publication]:
+        return [pub for pub in publications if len(pub.abstract or '') <= self.min_length]
+
+    def _lookup(self, provider: Provider, missing: list[Publication]) -> dict[str, str]:
+        others = [pub for pub in missing if pub.provider_name != provider.name]
+        dois = sorted({pub.doi.lower() for pub in others if pub.doi})
+        titles = sorted({pub.title for pub in others if not pub.doi and pub.title})
+        if not dois and not titles:
+            return {}
+        logger.info(f'{provider.name}: looking up {len(dois)} DOIs and {len(titles)} titles')
+        return provider.lookup_abstracts(dois, titles)
+
+    def enrich(self, publications: list[Publication]) -> int:
+        """Fill in the missing abstracts of `publications` in place, returning how many."""
+        missing = self.missing(publications)
+        providers = [provider for provider in self.providers if provider.bulk_lookup]
+        if not missing or not providers:
+            return 0
+
+        found: dict[str, str] = {}
+        with ThreadPoolExecutor(
+            max_workers=len(providers), thread_name_prefix='pysota-enrich'
+        ) as pool:
+            futures = {pool.submit(self._lookup, p, missing): p.name for p in providers}
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    logger.warning(f'{futures[future]}: abstract lookup failed: {error}')
+                    continue
+                for key, abstract in future.result().items():
+                    if len(abstract) > len(found.get(key, '')):
+                        found[key] = abstract
+
+        filled = 0
+        for pub in missing:
+            abstract = found.get(pub.doi.lower() if pub.doi else pub.title, '')
+            if len(abstract) > len(pub.abstract or ''):
+                pub.abstract = abstract
+                filled += 1
+        logger.info(f'Backfilled {filled} of {len(missing)} missing abstracts')
+        return filled
@@ -30,6 +30,9 @@ class DocsLibrary(BaseModel):
             self.store[pub.id] = pub
 
     def get_document(self, id: str) -> Publication | None:
+        if len(self.store) == 0:
+            # a point lookup rather than loading the whole folder
+            return Persistence.load_file_by_name(self.folder, id)
         pub = self.store.get(id)
         return pub
 
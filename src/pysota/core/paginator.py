@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from pydantic import BaseModel, Field
+from rich import print
+
+from pysota.core import IQuery, ResultPage
+
+if TYPE_CHECKING:
+    from pysota.core import HarvestCheckpoint, Provider
+
+
+class Paginator(BaseModel):
+    """
+    Prefetching paginator for providers with offset based pagination.
+
+    The first page is fetched to learn `total`, then the offsets of every remaining page are
+    computed up front and up to `prefetch` of them are kept in flight. The provider rate
+    limiter keeps the requests within its politeness limits, however many are in flight.
+    Pages are yielded in offset order.
+
+    Providers paging by cursor are walked with `cursor_pages` instead.
+
+    Both stop at an optional `deadline` (a `time.monotonic()` value): pages still in flight
+    are abandoned, their requests timing out by the deadline, and the checkpoint, if any, is
+    left incomplete.
+    """
+
+    prefetch: int = Field(default=4, ge=1)
+
+    @staticmethod
+    def _arrived(provider: Provider, future: Future, deadline: float | None) -> bool:
+        """Wait for a page until the deadline, telling whether it arrived in time."""
+        if deadline is None or future.done():
+            return True
+        if wait([future], timeout=max(deadline - time.monotonic(), 0)).done:
+            return True
+        print(f'[yellow]Warning:[/yellow] {provider.name} deadline reached, stopping')
+        logger.warning(f'{provider.name}: deadline reached with pages still in flight')
+        return False
+
+    def offsets(self, start: int, total: int, step: int) -> list[int]:
+        if step <= 0:
+            return []
+        return list(range(start, total, step))
+
+    def pages(
+        self,
+        provider: Provider,
+        query: IQuery,
+        checkpoint: HarvestCheckpoint | None = None,
+        deadline: float | None = None,
+    ) -> Iterator[ResultPage]:
+        """
+        Yield the pages of `query` in offset order.
+
+        With a `checkpoint`, pages it already holds are not downloaded again; when its total
+        is known even the first page is skipped. The checkpoint is marked complete once every
+        page has been recorded.
+        """
+        start, step = query.start_index, query.items_per_page
+        if checkpoint is not None and checkpoint.total >= 0 and checkpoint.is_done(start):
+            total = checkpoint.total
+        else:
+            first = provider.search_until(query, deadline)
+            total = first.total
+            yield first
+
+        all_offsets = self.offsets(start, total, step)
+        remaining = [o for o in all_offsets[1:] if checkpoint is None or not checkpoint.is_done(o)]
+        pending: deque[tuple[int, Future[ResultPage]]] = deque()
+        offsets = iter(remaining)
+
+        def submit(pool: ThreadPoolExecutor) -> None:
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append(
+                    (offset, pool.submit(provider.search_until, query.page_at(offset), deadline))
+                )
+
+        pool = ThreadPoolExecutor(
+            max_workers=self.prefetch, thread_name_prefix=f'pysota-{provider.name}'
+        )
+        try:
+            for _ in range(self.prefetch):
+                submit(pool)
+            while pending:
+                offset, future = pending.popleft()
+                if not self._arrived(provider, future, deadline):
+                    return
+                submit(pool)
+                error = future.exception()
+                if error is not None:
+                    print(f'[red]Caught![/red] {provider.name} page at {offset}: {error}')
+                    logger.warning(f'{provider.name}: page at {offset} failed: {error}')
+                    continue
+                print(f'Fetched page of results starting at index {offset}')
+                yield future.result()
+        finally:
+            # pages left in flight (deadline, consumer stopping early) are not waited for
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if checkpoint is not None:
+            checkpoint.finish(all_offsets)
+
+    def cursor_pages(
+        self,
+        provider: Provider,
+        query: IQuery,
+        checkpoint: HarvestCheckpoint | None = None,
+        deadline: float | None = None,
+    ) -> Iterator[ResultPage]:
+        """
+        Yield the pages of `query` by following the cursor each page returns for the next one.
+
+        The next page can only be requested once its cursor is known, so a single page is
+        fetched ahead while the current one is consumed. With a `checkpoint`, the harvest
+        resumes from its last recorded cursor; cursors expire on the provider side, so if that
+        one is rejected the harvest restarts, once, from the first page and the publications
+        already saved are skipped by the checkpoint. Any later failure stops the harvest, the
+        checkpoint left incomplete so that the next run resumes it.
+        """
+        step = query.items_per_page
+        current = query
+        if checkpoint is not None and checkpoint.cursor and checkpoint.done_offsets:
+            current = query.page_at(max(checkpoint.done_offsets) + step, checkpoint.cursor)
+        resumed, first = current is not query, True
+
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'pysota-{provider.name}')
+        try:
+            future: Future[ResultPage] | None = pool.submit(
+                provider.search_until, current, deadline
+            )
+            while future is not None:
+                if not self._arrived(provider, future, deadline):
+                    return
+                try:
+                    page = future.result()
+                except Exception as e:
+                    if resumed and first:
+                        print(
+                            f'[yellow]Warning:[/yellow] {provider.name} cursor expired, restarting'
+                        )
+                        logger.warning(f'{provider.name}: resuming from cursor failed: {e}')
+                        resumed, current = False, query
+                        future = pool.submit(provider.search_until, current, deadline)
+                        continue
+                    if first:
+                        raise
+                    print(f'[red]Caught![/red] {provider.name} page at {current.start_index}: {e}')
+                    logger.warning(
+                        f'{provider.name}: page at {current.start_index} failed, stopping: {e}'
+                    )
+                    return
+
+                first = False
+                offset = page.start_index + step
+                future = None
+                if page.items and page.next_cursor and (page.total < 0 or offset < page.total):
+                    current = query.page_at(offset, page.next_cursor)
+                    future = pool.submit(provider.search_until, current, deadline)
+                print(f'Fetched page of results starting at index {page.start_index}')
+                yield page
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if checkpoint is not None:
+            checkpoint.complete = True
+            checkpoint.save()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import requests
+from loguru import logger
+from pydantic import BaseModel, Field
+from rich import print
+
+from pysota.core import ResultPage, ResultSink
+from pysota.core.response_cache import _WIRE_HEADERS, build_response
+
+if TYPE_CHECKING:
+    from pysota.core import IQuery, Provider
+
+
+class PayloadArchive(BaseModel):
+    """
+    Archive of the raw provider responses, to rebuild the results without the network.
+
+    Every response a provider parses into a page is kept under
+    `folder/<provider>/<query name>/<key>.gz`, a gzip file holding a JSON header line (provider
+    class, query, url, status, headers, archive time) followed by the raw body, as in the
+    `ResponseCache`. Archived responses never expire: `replay` parses them again with the
+    current provider code, e.g. after a fix to an `extract_items`.
+    """
+
+    folder: Path = Field(default=Path('./results/archive'))
+
+    def _path(self, provider: str, query_name: str, url: str) -> Path:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.folder.joinpath(provider, query_name, f'{key}.gz')
+
+    def put(self, provider: Provider, query: IQuery, response: requests.Response) -> None:
+        path = self._path(provider.name, query.name, response.url)
+        if getattr(response, 'from_cache', False) and path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        provider_type = type(provider)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS}
+        meta = {
+            'provider': provider.name,
+            'provider_class': f'{provider_type.__module__}:{provider_type.__qualname__}',
+            'query': query.model_dump(mode='json'),
+            'url': response.url,
+            'status': response.status_code,
+            'headers': headers,
+            'archived': time.time(),
+        }
+        tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with gzip.open(tmp, 'wb') as f:
+            f.write(json.dumps(meta).encode() + b'\n')
+            f.write(response.content)
+        os.replace(tmp, path)
+        logger.debug(f'Archived {provider.name} {response.url}')
+
+    def entries(self, query_name: str | None = None) -> list[Path]:
+        return sorted(self.folder.glob(f'*/{query_name or "*"}/*.gz'))
+
+    def replay(
+        self, results_dir: Path, query_name: str | None = None, workers: int | None = None
+    ) -> list[ResultSink]:
+        """
+        Rebuild `results_dir/<query name>/<provider>` from the archive, without the network.
+
+        Responses are parsed in `workers` processes (one per core by default). The publications
+        already in a rebuilt folder are replaced; pages are written in order through a merging
+        sink, so publications found by several archived requests are saved once.
+        """
+        paths = self.entries(query_name)
+        print(f'Replaying {len(paths)} archived responses from [green]{self.folder}[/green]')
+        logger.info(f'Replaying {len(paths)} archived responses from {self.folder}')
+
+        groups: dict[tuple[str, str], list[ResultPage]] = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for page in pool.map(replay_entry, paths, chunksize=16):
+                if page is not None:
+                    groups.setdefault((page.query.name, page.query.provider), []).append(page)
+
+        sinks = []
+        for (name, provider), pages in sorted(groups.items()):
+            path = results_dir.joinpath(name).joinpath(provider)
+            for file in path.glob('*.yaml'):
+                if not file.name.startswith('_') and file.stem.rsplit('-', 1)[-1].isdigit():
+                    file.unlink()
+            sink = ResultSink(path=path, merge=True)
+            for page in sorted(pages, key=lambda p: (str(p.query.since), p.start_index)):
+                sink.write(page)
+            sink.close()
+            sinks.append(sink)
+        return sinks
+
+
+# an unreadable entry, a provider class that is gone, or a body the parser now rejects (XML
+# parse errors are SyntaxErrors)
+_REPLAY_ERRORS = (
+    OSError,
+    ImportError,
+    AttributeError,
+    LookupError,
+    TypeError,
+    ValueError,
+    SyntaxError,
+)
+
+
+def replay_entry(path: Path) -> ResultPage | None:
+    """Parse an archived response into its page again, with the current provider code."""
+    try:
+        with gzip.open(path, 'rb') as f:
+            meta = json.loads(f.readline())
+            body = f.read()
+        module, qualname = meta['provider_class'].split(':')
+        provider = getattr(importlib.import_module(module), qualname)()
+        query = provider.query_type.model_validate(meta['query'])
+        response = build_response(meta['url'], meta['status'], meta['headers'], body)
+        return provider._build_results_page(response, query)
+    except _REPLAY_ERRORS as e:
+        logger.warning(f'Cannot replay {path}: {e}')
+        return None
@@ -1,50 +1,53 @@
 from pathlib import Path
-
-from omegaconf import OmegaConf
-from rich import print
+from typing import ClassVar
 
 from pysota.core import Publication
+from pysota.core.storage import ParquetStorage, SqliteStorage, StorageBackend, YamlStorage
 
 
 class Persistence:
+    # by format name; a folder is read with the first backend holding a DB there
+    backends: ClassVar[dict[str, StorageBackend]] = {
+        backend.format: backend for backend in (ParquetStorage(), SqliteStorage(), YamlStorage())
+    }
+
+    @staticmethod
+    def backend(path: Path, format: str | None = None) -> StorageBackend:
+        """The backend of `format`, or the one of the DB at `path` (YAML by default)."""
+        if format is not None:
+            if format not in Persistence.backends:
+                raise ValueError(
+                    f'Unknown format {format}, choose from {list(Persistence.backends)}'
+                )
+            return Persistence.backends[format]
+        for backend in Persistence.backends.values():
+            if backend.holds(path):
+                return backend
+        return Persistence.backends[YamlStorage.format]
+
     @staticmethod
     def publication_factory(file: Path) -> Publication:
-        yaml_conf = OmegaConf.load(file)
-        plain_dict = OmegaConf.to_container(yaml_conf, resolve=True)
-        return Publication(**plain_dict)  # type: ignore
+        return YamlStorage.publication_factory(file)
+
+    @staticmethod
+    def load_files(
+        path: Path, query_name: str = '', format: str | None = None
+    ) -> list[Publication]:
+        backend = Persistence.backend(path.joinpath(query_name), format)
+        return backend.load(path, query_name)
 
     @staticmethod
-    def load_files(path: Path, query_name: str = '') -> list[Publication]:
-        files = list(path.joinpath(query_name).glob('**/*.yaml'))
-        db = []
-        for file in files:
-            if file.name == '_index.yaml':
-                print(f'[yellow]skipping:[/yellow] {file.name}')
-                continue
-            try:
-                db.append(Persistence.publication_factory(file))
-            except Exception as e:
-                print(f'[red]Caught![/red]:{file.name}\n{e}')
-                continue
-        return db
+    def save_files(db: list[Publication], path: Path, format: str = YamlStorage.format) -> None:
+        Persistence.backend(path, format).save(db, path)
 
     @staticmethod
-    def save_files(db: list[Publication], path: Path) -> None:
-        path.mkdir(parents=True, exist_ok=True)
-        index = {}
-        for i in db:
-            i.save(path)
-            index[i.id] = i.title
-        index_dump = OmegaConf.create(index)
-        index_path = path.joinpath('_index.yaml')
-        index_path.touch()
-        with index_path as f:
-            OmegaConf.save(index_dump, f)
+    def load_file_by_name(
+        db_path: Path, file_name: str, format: str | None = None
+    ) -> Publication | None:
+        return Persistence.backend(db_path, format).load_by_name(db_path, file_name)
 
     @staticmethod
-    def load_file_by_name(db_path: Path, file_name: str) -> Publication | None:
-        file_path = db_path.joinpath(f'{file_name}.yaml')
-        if not file_path.exists():
-            print(f'Target file not found: [red]{file_path}[/red]')
-            return None
-        return Persistence.publication_factory(file_path)
+    def load_files_by_name(
+        db_path: Path, file_names: list[str], format: str | None = None
+    ) -> list[Publication | None]:
+        return Persistence.backend(db_path, format).load_many(db_path, file_names)
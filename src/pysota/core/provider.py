@@ -1,13 +1,109 @@
+import io
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
 from functools import singledispatchmethod
+from typing import IO, ClassVar
 
-from pydantic import BaseModel, Field
+import requests
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
 
-from pysota.core import IQuery, Publication, ResultPage
+from pysota.core import (
+    CacheMissError,
+    CircuitBreaker,
+    HarvestCheckpoint,
+    HttpTransport,
+    IQuery,
+    Paginator,
+    PayloadArchive,
+    Publication,
+    RateLimit,
+    RateLimiter,
+    ResponseCache,
+    ResultPage,
+)
 
 
 class Provider(ABC, BaseModel):
+    # IQuery subclass understood by the provider, used by `make_query`
+    query_type: ClassVar[type[IQuery]]
+    # cursor of the first page of a result set, for providers that can page by cursor
+    start_cursor: ClassVar[str | None] = None
+    # largest page the provider serves, used when paging through a whole result set
+    harvest_page_size: ClassVar[int | None] = None
+    # abstracts can be looked up in bulk by DOI or title (see `lookup_abstracts`)
+    bulk_lookup: ClassVar[bool] = False
+
     name: str = Field(...)
+    prefetch: int = Field(default=4, ge=1)
+    # deepest offset the provider serves for a query paged by offset, None when unbounded
+    max_depth: int | None = Field(default=None, ge=1)
+    # harvest by continuation cursor (see `harvest_query`), which has no depth limit
+    cursor_paging: bool = Field(default=False)
+    rate_limit: RateLimit = Field(default=RateLimit(rate=5.0, burst=5, max_concurrent=4))
+    # seconds a search may take before the engine gives up on the provider, also caps the
+    # read timeout of every request
+    timeout: float | None = Field(default=None, gt=0)
+    # seconds after which an unanswered GET is sent again, the first answer wins; it only
+    # helps providers allowing more than one request in flight
+    hedge_after: float | None = Field(default=None, gt=0)
+    breaker: CircuitBreaker = Field(default_factory=CircuitBreaker, exclude=True)
+    transport: HttpTransport = Field(default_factory=HttpTransport, exclude=True)
+    cache: ResponseCache | None = Field(default=None, exclude=True)
+    archive: PayloadArchive | None = Field(default=None, exclude=True)
+
+    _limiter: RateLimiter = PrivateAttr()
+    _hedge_pool: ThreadPoolExecutor | None = PrivateAttr(default=None)
+    _hedge_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # `time.monotonic()` deadline of the search running in each thread, see `search_until`
+    _deadline: threading.local = PrivateAttr(default_factory=threading.local)
+
+    def model_post_init(self, context, /) -> None:
+        self._limiter = RateLimiter(limit=self.rate_limit)
+        self.breaker.name = self.name
+
+    def make_query(
+        self, name: str, include: list, exclude: list, num_items: int, offset: int
+    ) -> IQuery:
+        return self.query_type(
+            name=name,
+            provider=self.name,
+            include=include,
+            exclude=exclude,
+            items_per_page=num_items,
+            start_index=offset,
+        )
+
+    def harvest_query(self, query: IQuery) -> IQuery:
+        """
+        Query to page through the whole result set of `query`.
+
+        With `cursor_paging`, a query starting at the first result is moved to the first cursor
+        of the provider; otherwise it is paged by offset. Pages are enlarged to
+        `harvest_page_size`, so the result set takes as few requests as possible.
+        """
+        if (
+            self.cursor_paging
+            and self.start_cursor is not None
+            and query.cursor is None
+            and query.start_index == 0
+        ):
+            query = query.page_at(0, self.start_cursor)
+        if self.harvest_page_size is not None and query.items_per_page < self.harvest_page_size:
+            query = query.model_copy(update={'items_per_page': self.harvest_page_size})
+        return query
+
+    def lookup_abstracts(self, dois: list[str], titles: list[str]) -> dict[str, str]:
+        """
+        Abstracts the provider holds for the given DOIs and titles, in as few requests as it can.
+
+        Results are keyed by DOI (lower case) or by title as given. Providers without a bulk
+        lookup find nothing.
+        """
+        return {}
 
     @abstractmethod
     def extract_items(self, payload, query: IQuery) -> list[Publication]:
@@ -22,5 +118,216 @@ class Provider(ABC, BaseModel):
     def search_next(self, result_page: ResultPage) -> ResultPage:
         raise NotImplementedError
 
+    def search_until(self, query: IQuery, deadline: float | None) -> ResultPage:
+        """`search`, every request it sends timing out by the `deadline` (`time.monotonic()`)."""
+        previous = getattr(self._deadline, 'value', None)
+        self._deadline.value = deadline
+        try:
+            return self.search(query)
+        finally:
+            self._deadline.value = previous
+
+    def _build_results_page(self, response: requests.Response, query: IQuery) -> ResultPage:
+        # page of `query` parsed from its response, also used to replay archived responses
+        raise NotImplementedError
+
+    def fetch(
+        self,
+        url: str,
+        params: dict | None = None,
+        cached: bool = True,
+        query: IQuery | None = None,
+        cache_key: str | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        GET `url` within the provider rate limit, through the response cache if there is one.
+
+        Responses are cached under the request URL, or under `cache_key` when the URL holds
+        something that changes from run to run (e.g. a search session id). Responses bound to
+        server side state that expires should be fetched with `cached=False`: they are always
+        requested again, but still stored, so offline mode can replay the last one. Responses
+        to a search `query` are kept in the payload archive, if there is one.
+        """
+        entry = None
+        full_url = url
+        if self.cache is not None:
+            full_url = cache_key or requests.Request('GET', url, params=params).prepare().url or url
+            if cached or self.cache.offline:
+                entry = self.cache.get(self.name, full_url, stale=True)
+            if entry is not None and not entry.expired:  # type: ignore[attr-defined]
+                if self.archive is not None and query is not None:
+                    self.archive.put(self, query, entry)
+                return entry
+            if self.cache.offline:
+                raise CacheMissError(f'{self.name}: {full_url} is not cached (offline mode)')
+            if entry is not None:
+                # an expired entry is revalidated, the body is only sent again if it changed
+                conditional = self.cache.validators(entry)
+                kwargs['headers'] = {**(kwargs.get('headers') or {}), **conditional}
+                entry = entry if conditional else None
+
+        # hedged requests are sent from other threads, the deadline goes along
+        kwargs['deadline'] = getattr(self._deadline, 'value', None)
+        if self.hedge_after is not None:
+            response = self._hedged(url, params=params, **kwargs)
+        else:
+            response = self._send(self.transport.get, url, params=params, **kwargs)
+        if self.cache is not None and entry is not None and response.status_code == 304:
+            response.close()
+            logger.debug(f'{self.name}: {entry.url} not modified')
+            self.cache.renew(self.name, full_url, entry)
+            response = entry
+        elif self.cache is not None:
+            self.cache.put(self.name, full_url, response)
+        if self.archive is not None and query is not None:
+            self.archive.put(self, query, response)
+        return response
+
+    def post(self, url: str, params: dict | None = None, **kwargs) -> requests.Response:
+        """POST to `url` within the provider rate limit; POST responses are never cached."""
+        if self.cache is not None and self.cache.offline:
+            raise CacheMissError(f'{self.name}: POST {url} cannot be served offline')
+        deadline = getattr(self._deadline, 'value', None)
+        return self._send(self.transport.post, url, params=params, deadline=deadline, **kwargs)
+
+    def _timeout(self, deadline: float | None) -> tuple[float, float]:
+        """Connect and read timeouts of a request, none running past the `deadline`."""
+        connect, read = self.transport.timeout
+        if self.timeout is not None:
+            read = min(read, self.timeout)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.Timeout(f'{self.name}: deadline passed')
+            connect, read = min(connect, remaining), min(read, remaining)
+        return connect, read
+
+    def _send(
+        self,
+        method: Callable[..., requests.Response],
+        url: str,
+        deadline: float | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        # the retries of the transport are sent from here rather than from the session, so that
+        # the backoff does not hold a connection slot and no attempt runs past the deadline
+        retries = self.transport.retries
+        for attempt in range(retries + 1):
+            error: requests.RequestException | None = None
+            try:
+                with self._limiter.slot(deadline):
+                    response = method(url, timeout=self._timeout(deadline), **kwargs)
+            except (requests.ConnectionError, requests.ReadTimeout) as e:
+                error = e
+            else:
+                self._limiter.feedback(response)
+                if response.status_code == 429:
+                    # the limiter is paused and slower, the request waits its turn again
+                    continue
+                if response.status_code not in self.transport.retry_statuses:
+                    break
+            delay = self.transport.backoff(attempt + 1)
+            if attempt == retries or (deadline is not None and time.monotonic() + delay > deadline):
+                break
+            logger.debug(f'{self.name}: {error or response.status_code}, retrying in {delay:.1f}s')
+            if error is None:
+                response.close()
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        response.raise_for_status()
+        return response
+
+    def _hedged(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET `url`, sending the same request again if it has not been answered in `hedge_after`.
+
+        The first successful answer is returned and the other one closed when it arrives; the
+        request only fails if both do.
+        """
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=2 * max(self.prefetch, self.rate_limit.max_concurrent),
+                    thread_name_prefix=f'pysota-hedge-{self.name}',
+                )
+            pool = self._hedge_pool
+
+        first = pool.submit(self._send, self.transport.get, url, **kwargs)
+        if wait([first], timeout=self.hedge_after).done:
+            return first.result()
+        logger.debug(f'{self.name}: no answer after {self.hedge_after}s, hedging {url}')
+        futures = [first, pool.submit(self._send, self.transport.get, url, **kwargs)]
+        for future in as_completed(futures):
+            if future.exception() is None:
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                return future.result()
+        raise first.exception()  # type: ignore[misc]
+
+    @staticmethod
+    def body_stream(response: requests.Response) -> IO[bytes]:
+        """
+        Readable stream over the decoded body of a response.
+
+        Responses fetched with `stream=True` are read straight from the socket, gzip/deflate
+        decoded on the fly; responses whose body is already in memory (e.g. cache hits) are
+        wrapped in a `BytesIO`.
+        """
+        if response._content_consumed or response.raw is None:  # type: ignore[attr-defined]
+            return io.BytesIO(response.content)
+        response.raw.decode_content = True
+        return response.raw
+
+    def iter_pages(
+        self,
+        query: IQuery,
+        checkpoint: HarvestCheckpoint | None = None,
+        deadline: float | None = None,
+    ) -> Iterator[ResultPage]:
+        """
+        Yield every page of results of a query, in order, as they are downloaded.
+
+        Pages already recorded in `checkpoint` are skipped. Queries carrying a cursor are
+        paged by following it. Paging stops at the `deadline` (a `time.monotonic()` value).
+        """
+        paginator = Paginator(prefetch=self.prefetch)
+        if query.cursor is not None:
+            return paginator.cursor_pages(self, query, checkpoint, deadline)
+        return paginator.pages(self, query, checkpoint, deadline)
+
+    def count(self, query: IQuery) -> int:
+        """Total number of results of `query`, fetching a single result."""
+        probe = query.page_at(0).model_copy(update={'items_per_page': 1})
+        return self.search(probe).total
+
+    def search_all(self, query: IQuery, deadline: float | None = None) -> ResultPage:
+        """
+        Every result of `query` in a single page.
+
+        Past the `deadline` (a `time.monotonic()` value) the pages downloaded so far are
+        returned, marked `partial`.
+        """
+        self.log('Searching all results')
+        query = self.harvest_query(query)
+        pages = self.iter_pages(query, deadline=deadline)
+        results = next(pages)
+        for page in pages:
+            results.extend(page)
+        expected = max(results.total - query.start_index, 0)
+        if deadline is not None and time.monotonic() >= deadline and results.num_items < expected:
+            results.partial = True
+            self.log(f'Deadline reached, returning {results.num_items} of {results.total} results')
+        self.log(f'Downloaded {results.num_items} of {results.total} results')
+        return results
+
     def log(self, msg) -> None:
         print(f'- {msg}')
+
+
+def _close_response(future: Future[requests.Response]) -> None:
+    # the answer that lost a hedged race is dropped, its connection goes back to the pool
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -2,14 +2,22 @@ import re
 import textwrap
 from functools import cached_property
 from pathlib import Path
+from typing import ClassVar
 
 import numpy as np
 import numpy.typing as npt
 from omegaconf import OmegaConf
 from pydantic import BaseModel, PrivateAttr, computed_field
 
+# vectors of the publications built by `Publication.trusted`, until `vectorise` replaces them
+NO_VECTORS = np.array([])
+
 
 class Publication(BaseModel):
+    # layout of the saved publications: bump it when the fields change, so the DBs saved
+    # before are validated again when loaded instead of trusted
+    schema_version: ClassVar[int] = 1
+
     title: str
     year: int
     authors: list[str]
@@ -17,6 +25,10 @@ class Publication(BaseModel):
     provider_name: str
     query_name: str
     abstract: str
+    # ISO publication date (YYYY-MM-DD) when the provider reports one
+    published: str = ''
+    # DOI without the resolver prefix, when the provider reports one
+    doi: str = ''
     _vectors: npt.ArrayLike = PrivateAttr(default=np.array([]))
 
     class Config:
@@ -27,6 +39,23 @@ class Publication(BaseModel):
     def id(self) -> str:
         return f'{self.query_name}-{self.provider_name.lower()}-{self.internal_index:03d}'
 
+    @classmethod
+    def trusted(cls, fields: dict) -> 'Publication':
+        """
+        Publication from the fields pysota saved it with, without validating them.
+
+        Only for DBs stamped with the current `schema_version`. Like `model_construct`, but
+        `fields` becomes the instance dict as is and the saved `id` is dropped, to be computed
+        again when needed.
+        """
+        fields.pop('id', None)
+        pub = cls.__new__(cls)
+        object.__setattr__(pub, '__dict__', fields)
+        object.__setattr__(pub, '__pydantic_fields_set__', set(fields))
+        object.__setattr__(pub, '__pydantic_extra__', None)
+        object.__setattr__(pub, '__pydantic_private__', {'_vectors': NO_VECTORS})
+        return pub
+
     def check_validity(self):
         if not self.year > 0:
             return False, f'year = {self.year}'
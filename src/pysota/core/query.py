@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from datetime import date
 from pathlib import Path
 
 from omegaconf import OmegaConf
@@ -13,13 +14,40 @@ class IQuery(BaseModel, ABC):
     exclude: list[str] = Field(..., frozen=True)
     items_per_page: int = Field(..., frozen=True)
     start_index: int = Field(..., frozen=True)
+    # watermark: only publications from this date on (inclusive) are requested
+    since: date | None = Field(default=None, frozen=True)
+    # shard bound: only publications up to this date (inclusive) are requested
+    until: date | None = Field(default=None, frozen=True)
+    # continuation cursor for providers that page by cursor, None pages by `start_index`
+    cursor: str | None = Field(default=None, frozen=True)
 
     @abstractmethod
     def generate_url(self) -> str:
         raise NotImplementedError
 
+    @property
+    def dated(self) -> bool:
+        return self.since is not None or self.until is not None
+
+    def page_at(self, start_index: int, cursor: str | None = None) -> 'IQuery':
+        """
+        Copy of this query pointing at another page of the same result set.
+
+        With a `cursor`, the page is the one the cursor leads to and `start_index` only numbers
+        its items.
+        """
+        return self.model_copy(update={'start_index': start_index, 'cursor': cursor})
+
+    def newer_than(self, since: date | None) -> 'IQuery':
+        """Copy of this query restricted to publications from `since` on."""
+        return self.model_copy(update={'since': since})
+
+    def between(self, since: date, until: date) -> 'IQuery':
+        """Copy of this query restricted to publications from `since` to `until`."""
+        return self.model_copy(update={'since': since, 'until': until})
+
     def save_query(self, path: Path) -> None:
-        dump = OmegaConf.create(self.model_dump())
+        dump = OmegaConf.create(self.model_dump(mode='json'))
         filename = f'{self.name}.yaml'
         full_path = path.joinpath(filename)
         if full_path.exists():
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from pydantic import BaseModel, Field
+from rich import print
+
+from pysota.core import IQuery
+
+if TYPE_CHECKING:
+    from pysota.core import Provider
+
+
+class QueryPlanner(BaseModel):
+    """
+    Splits a query into date-range shards that can each be paged through completely.
+
+    Providers stop serving results past a certain offset (`Provider.max_depth`), so a broad
+    query cannot be harvested by paging alone. The planner probes the total of the query and
+    halves its date range until every shard holds at most that many results. Shards are probed
+    in parallel one level at a time; a single day that is still too large is kept as is and
+    harvested as deep as the provider allows.
+    """
+
+    # lower bound of the date range of queries without `since`
+    earliest: date = Field(default=date(1900, 1, 1))
+    max_workers: int = Field(default=4, ge=1)
+
+    @staticmethod
+    def split(query: IQuery) -> list[IQuery]:
+        since, until = query.since, query.until
+        assert since is not None and until is not None
+        middle = since + (until - since) // 2
+        return [query.between(since, middle), query.between(middle + timedelta(days=1), until)]
+
+    def plan(self, provider: Provider, query: IQuery) -> list[IQuery]:
+        """Shards of `query` for `provider`, in date order; the query itself if it fits."""
+        limit = provider.max_depth
+        if limit is None or query.cursor is not None:
+            return [query]
+
+        root = query.page_at(0).between(query.since or self.earliest, query.until or date.today())
+        pending, shards = [root], []
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f'pysota-plan-{provider.name}'
+        ) as pool:
+            while pending:
+                level = []
+                for shard, total in zip(pending, pool.map(provider.count, pending)):
+                    if shard is root and total <= limit:
+                        return [query]
+                    if total <= limit or shard.since == shard.until:
+                        if total > limit:
+                            logger.warning(
+                                f'{provider.name}: {total} results on {shard.since} exceed {limit}'
+                            )
+                        if total > 0:
+                            shards.append(shard)
+                    else:
+                        level.extend(self.split(shard))
+                pending = level
+
+        shards.sort(key=lambda shard: shard.since)
+        print(f'[cyan]{provider.name}[/cyan]: split into {len(shards)} date ranges')
+        logger.info(f'{provider.name}: query split into {len(shards)} shards of at most {limit}')
+        return shards
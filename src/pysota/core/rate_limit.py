@@ -0,0 +1,149 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class RateLimit(BaseModel, frozen=True):
+    """
+    Published rate limit of a provider.
+
+    Attributes:
+        rate: sustained requests per second.
+        burst: requests that may be sent back to back before the rate applies.
+        max_concurrent: connections allowed to be open against the provider at once.
+    """
+
+    rate: float = Field(default=5.0, gt=0)
+    burst: int = Field(default=1, ge=1)
+    max_concurrent: int = Field(default=4, ge=1)
+
+
+class RateLimiter(BaseModel):
+    """
+    Adaptive token bucket enforcing a `RateLimit`.
+
+    The bucket starts at the declared rate. Rate headers sent by the provider
+    (`X-Rate-Limit-Limit`/`X-Rate-Limit-Interval`, `X-RateLimit-Limit`/`X-RateLimit-Remaining`)
+    lower the ceiling to what the server announces. A 429 halves the current rate and pauses
+    the bucket for `Retry-After` seconds; every successful request then raises the rate back
+    towards the ceiling in small additive steps.
+    """
+
+    limit: RateLimit
+    min_rate: float = Field(default=0.05, gt=0)
+    recovery: float = Field(default=0.05, gt=0, le=1)
+
+    _rate: float = PrivateAttr()
+    _ceiling: float = PrivateAttr()
+    _tokens: float = PrivateAttr()
+    _updated: float = PrivateAttr(default_factory=time.monotonic)
+    _paused_until: float = PrivateAttr(default=0.0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _slots: threading.BoundedSemaphore = PrivateAttr()
+
+    def model_post_init(self, context, /) -> None:
+        self._rate = self.limit.rate
+        self._ceiling = self.limit.rate
+        self._tokens = float(self.limit.burst)
+        self._slots = threading.BoundedSemaphore(self.limit.max_concurrent)
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self, now: float) -> None:
+        # no tokens accumulate while the provider asked us to back off
+        elapsed = now - max(self._updated, self._paused_until)
+        if elapsed <= 0:
+            self._updated = now
+            return
+        self._tokens = min(float(self.limit.burst), self._tokens + elapsed * self._rate)
+        self._updated = now
+
+    def acquire(self, deadline: float | None = None) -> None:
+        """
+        Block until a token is available, raising `requests.Timeout` if none will be before the
+        `deadline` (a `time.monotonic()` value).
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self._rate
+            if deadline is not None and now + wait >= deadline:
+                raise requests.Timeout('deadline passed waiting for the rate limit')
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, deadline: float | None = None) -> Iterator[None]:
+        """
+        Hold one of the concurrent connection slots and a token for a single request, raising
+        `requests.Timeout` if they cannot be had before the `deadline`.
+        """
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if not self._slots.acquire(timeout=timeout):
+            raise requests.Timeout('deadline passed waiting for a connection slot')
+        try:
+            self.acquire(deadline)
+            yield
+        finally:
+            self._slots.release()
+
+    def feedback(self, response: requests.Response) -> None:
+        """Adapt the rate to the headers and status of a provider response."""
+        with self._lock:
+            self._read_limit_headers(response)
+            if response.status_code == 429:
+                self._rate = max(self.min_rate, self._rate / 2)
+                pause = _retry_after(response) or 1 / self._rate
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                self._tokens = 0.0
+                logger.warning(
+                    f'Rate limited by {response.url}: pausing {pause:.1f}s, rate {self._rate:.2f}/s'
+                )
+            elif response.ok and self._rate < self._ceiling:
+                self._rate = min(self._ceiling, self._rate + self._ceiling * self.recovery)
+
+    def _read_limit_headers(self, response: requests.Response) -> None:
+        headers = response.headers
+        limit = headers.get('X-Rate-Limit-Limit') or headers.get('X-RateLimit-Limit')
+        interval = headers.get('X-Rate-Limit-Interval', '1s')
+        try:
+            if limit is not None:
+                seconds = float(interval.rstrip('s') or 1)
+                ceiling = min(self.limit.rate, float(limit) / seconds)
+                if ceiling != self._ceiling:
+                    logger.info(f'{response.url}: server rate limit {ceiling:.2f}/s')
+                self._ceiling = ceiling
+                self._rate = min(self._rate, ceiling)
+            remaining = headers.get('X-RateLimit-Remaining')
+            if remaining is not None and int(remaining) <= 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + 1.0)
+        except ValueError:
+            logger.debug(f'Unparseable rate limit headers: {dict(headers)}')
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class CircuitBreaker(BaseModel):
+    """
+    Circuit breaker isolating a provider that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and the provider is
+    skipped for `reset_timeout` seconds. Then a single trial call is let through (half open):
+    a success closes the circuit again, a failure opens it for another `reset_timeout`.
+    """
+
+    name: str = ''
+    failure_threshold: int = Field(default=3, ge=1)
+    reset_timeout: float = Field(default=60.0, gt=0)
+
+    _failures: int = PrivateAttr(default=0)
+    _opened_at: float | None = PrivateAttr(default=None)
+    _trial: bool = PrivateAttr(default=False)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half open state only one trial call does."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f'{self.name}: circuit closed')
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
+                logger.warning(
+                    f'{self.name}: circuit open after {self._failures} failures, '
+                    f'skipping it for {self.reset_timeout:.0f}s'
+                )
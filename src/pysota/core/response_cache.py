@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+from requests.structures import CaseInsensitiveDict
+
+# headers describing the wire encoding, the cached body is stored already decoded
+_WIRE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+def build_response(url: str, status: int, headers: dict, body: bytes) -> requests.Response:
+    """Rebuild a `requests.Response` from stored parts so providers can parse it as usual."""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = body
+    response._content_consumed = True  # type: ignore[attr-defined]
+    return response
+
+
+class ResponseCache(BaseModel):
+    """
+    Persistent HTTP response cache keyed by provider name and request URL.
+
+    Every entry is a gzip file holding a JSON header line (url, status, headers, creation time)
+    followed by the raw body. Entries older than `ttl` seconds are ignored, except in `offline`
+    mode where the cache is the only source and any request missing from it raises
+    `CacheMissError`. Reading an entry refreshes its modification time, so when the cache grows
+    beyond `max_bytes` the least recently used entries are evicted first.
+
+    Expired entries are not thrown away: their `ETag` / `Last-Modified` are sent back to the
+    provider (`validators`), and a `304 Not Modified` answer renews them without downloading
+    the body again. With `revalidate`, every entry is treated as expired, so each use costs a
+    conditional request instead of a full one.
+    """
+
+    folder: Path = Field(default=Path('./results/cache'))
+    ttl: float | None = Field(default=7 * 24 * 3600.0, gt=0)
+    max_bytes: int = Field(default=512 * 1024 * 1024, gt=0)
+    offline: bool = False
+    revalidate: bool = False
+
+    _size: int | None = PrivateAttr(default=None)
+    _not_modified: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @staticmethod
+    def key(provider: str, url: str) -> str:
+        return hashlib.sha256(f'{provider}\n{url}'.encode()).hexdigest()
+
+    def _path(self, provider: str, url: str) -> Path:
+        key = self.key(provider, url)
+        return self.folder.joinpath(key[:2], f'{key}.gz')
+
+    def get(self, provider: str, url: str, stale: bool = False) -> requests.Response | None:
+        """
+        Cached response to `url`, None if there is none or it has expired.
+
+        With `stale`, expired entries are returned as well, flagged with `expired`, so that
+        they can be revalidated.
+        """
+        path = self._path(provider, url)
+        try:
+            with gzip.open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f'Dropping corrupt cache entry {path}: {e}')
+            path.unlink(missing_ok=True)
+            return None
+
+        expired = self.revalidate or (
+            self.ttl is not None and time.time() - meta['created'] > self.ttl
+        )
+        if expired and not self.offline and not stale:
+            return None
+
+        os.utime(path)
+        response = build_response(meta['url'], meta['status'], meta['headers'], body)
+        response.from_cache = True  # type: ignore[attr-defined]
+        response.expired = expired and not self.offline  # type: ignore[attr-defined]
+        logger.debug(f'Cache {"entry" if expired else "hit"}: {provider} {url}')
+        return response
+
+    @staticmethod
+    def validators(response: requests.Response) -> dict[str, str]:
+        """Conditional request headers revalidating a cached response."""
+        headers = {}
+        if 'ETag' in response.headers:
+            headers['If-None-Match'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers
+
+    def renew(self, provider: str, url: str, response: requests.Response) -> None:
+        """Store again an entry the provider answered `304 Not Modified` for."""
+        with self._lock:
+            self._not_modified += 1
+        self.put(provider, url, response)
+
+    @property
+    def not_modified(self) -> int:
+        """Number of entries renewed by a `304 Not Modified` answer."""
+        return self._not_modified
+
+    def put(self, provider: str, url: str, response: requests.Response) -> None:
+        """
+        Store the response to a request for `url`.
+
+        Entries are keyed by the requested URL, the one `get` is called with, not by the final
+        URL of the response, which differs when the request was redirected.
+        """
+        path = self._path(provider, url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS}
+        meta = {
+            'provider': provider,
+            'url': response.url,
+            'status': response.status_code,
+            'headers': headers,
+            'created': time.time(),
+        }
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        with gzip.open(tmp, 'wb') as f:
+            f.write(json.dumps(meta).encode() + b'\n')
+            f.write(response.content)
+        previous = path.stat().st_size if path.exists() else 0
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += path.stat().st_size - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def discard(self, provider: str, url: str) -> None:
+        """Drop the entry of `url`, e.g. a response found to be an error page once parsed."""
+        path = self._path(provider, url)
+        if path.exists():
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            with self._lock:
+                if self._size is not None:
+                    self._size -= size
+
+    def _entries(self) -> list[Path]:
+        return list(self.folder.glob('*/*.gz'))
+
+    def _scan_size(self) -> int:
+        return sum(p.stat().st_size for p in self._entries())
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is below 90% of `max_bytes`."""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(((p.stat(), p) for p in self._entries()), key=lambda e: e[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in entries)
+        evicted = 0
+        for stat, path in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+            evicted += 1
+        self._size = size
+        logger.info(f'Evicted {evicted} entries from {self.folder}')
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
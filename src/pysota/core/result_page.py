@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import Callable
 from pathlib import Path
 
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from rich import print
 
 from pysota.core import IQuery, Publication
@@ -15,8 +16,14 @@ class ResultPage(BaseModel):
     items_per_page: int
     start_index: int
     items: list[Publication]
-
-    def save(self, path: Path) -> None:
+    # number of the pages merged into this one that were served from the response cache
+    cache_hits: int = Field(default=0)
+    # cursor of the following page, for providers that page by cursor
+    next_cursor: str | None = Field(default=None)
+    # the search hit its deadline, only the pages downloaded until then are held
+    partial: bool = Field(default=False)
+
+    def save(self, path: Path, enrich: Callable[[list[Publication]], int] | None = None) -> None:
         if len(self.items) == 0:
             print('No items to save')
             logger.info('No items to save')
@@ -25,33 +32,16 @@ class ResultPage(BaseModel):
         print(f'\n[cyan]{self.query.provider}[/cyan]: Files to be saved = {len(self.items)}')
         logger.info(f'{self.query.provider}: Files to be saved = {len(self.items)}')
 
-        path.mkdir(parents=True, exist_ok=True)
-        self.query.save_query(path)
-
-        saved = 0
-        error = 0
-        for item in self.items:
-            try:
-                valid, err = item.check_validity()
-                if not valid:
-                    logger.warning(f'Skipping publication:{item.title} because: Invalid {err}')
-                    error += 1
-                    continue
-
-                item.save(path)
-                saved += 1
-
-            except Exception:
-                error += 1
-                continue
+        # imported here, the sink module depends on this one
+        from pysota.core.result_sink import ResultSink
 
-        print(
-            f'Finished: Saved {saved} files to [green]{path}[/green] ([red]{error}[/red] not saved)'
-        )
-        logger.info(f'Finished: Saved {saved} files to {path} ({error} not saved)')
+        sink = ResultSink(path=path, enrich=enrich)
+        sink.write(self)
+        sink.close()
 
     def extend(self, other: ResultPage) -> None:
         self.items.extend(other.items)
+        self.cache_hits += other.cache_hits
 
     @property
     def num_items(self) -> int:
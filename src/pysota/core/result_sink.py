@@ -0,0 +1,142 @@
+import re
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+from rich import print
+
+from pysota.core import HarvestCheckpoint, Persistence, Publication, ResultPage
+
+
+class ResultSink(BaseModel):
+    """
+    Destination folder that persists result pages as they arrive.
+
+    The publications of each page written are checked (`Publication.check_validity`), the
+    invalid ones skipped, and the others saved right away with `Publication.save`, so a
+    harvest only ever holds the page being written in memory and everything written before a
+    crash stays on disk. With a `checkpoint`, every written page is recorded
+    in it and publications it already holds are not written again.
+
+    With `merge`, pages are added to the publications already in the folder: titles that are
+    already there are skipped and new publications are numbered after the existing ones, so
+    nothing on disk is overwritten.
+
+    Writes are serialised, so several harvests (e.g. the date shards of a query) may share
+    one sink, each recording its pages in its own checkpoint.
+
+    With `enrich` (e.g. `AbstractEnricher.enrich`), the items of every page are passed to it
+    before validation, so it can fill in what they are missing.
+    """
+
+    path: Path
+    checkpoint: HarvestCheckpoint | None = None
+    merge: bool = False
+    enrich: Callable[[list[Publication]], int] | None = Field(default=None, exclude=True)
+    # latest publication date among the saved publications
+    latest: str = ''
+    saved: int = Field(default=0)
+    errors: int = Field(default=0)
+    pages: int = Field(default=0)
+    cache_hits: int = Field(default=0)
+    enriched: int = Field(default=0)
+
+    _next_index: int = PrivateAttr(default=0)
+    _titles: set[str] = PrivateAttr(default_factory=set)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @staticmethod
+    def _title_key(title: str) -> str:
+        return re.sub(r'\W+', '', title.lower())
+
+    def _load_existing(self) -> None:
+        for file in self.path.glob('*.yaml'):
+            index = file.stem.rsplit('-', 1)[-1]
+            if file.name.startswith('_') or not index.isdigit():
+                continue
+            self._next_index = max(self._next_index, int(index) + 1)
+            self._titles.add(self._title_key(Persistence.publication_factory(file).title))
+        logger.info(f'Merging into {self.path}: {len(self._titles)} existing publications')
+
+    def _renumber(self, item: Publication) -> Publication:
+        dump = item.model_dump(exclude={'id'})
+        dump['internal_index'] = self._next_index
+        self._next_index += 1
+        return Publication(**dump)
+
+    def write(self, page: ResultPage, checkpoint: HarvestCheckpoint | None = None) -> int:
+        """
+        Persist the valid items of a page, returning how many were saved.
+
+        The page is recorded in `checkpoint`, or in the checkpoint of the sink if not given.
+        """
+        checkpoint = checkpoint or self.checkpoint
+        enriched = 0
+        if self.enrich is not None:
+            # looked up outside the lock, it goes over the network
+            saved_ids = checkpoint.saved_ids if checkpoint is not None else set()
+            enriched = self.enrich([item for item in page.items if item.id not in saved_ids])
+        with self._lock:
+            self.enriched += enriched
+            return self._write(page, checkpoint)
+
+    def _write(self, page: ResultPage, checkpoint: HarvestCheckpoint | None) -> int:
+        if self.pages == 0:
+            self.path.mkdir(parents=True, exist_ok=True)
+            page.query.save_query(self.path)
+            if self.merge:
+                self._load_existing()
+        self.pages += 1
+        self.cache_hits += page.cache_hits
+
+        since = page.query.since.isoformat() if page.query.since else ''
+        saved_ids = []
+        for item in page.items:
+            provider_id = item.id
+            if checkpoint is not None and provider_id in checkpoint.saved_ids:
+                continue
+            # partial dates (YYYY, YYYY-MM) are compared at their own precision
+            if item.published and item.published < since[: len(item.published)]:
+                continue
+            try:
+                valid, err = item.check_validity()
+                if not valid:
+                    logger.warning(f'Skipping publication:{item.title} because: Invalid {err}')
+                    self.errors += 1
+                    continue
+
+                if self.merge:
+                    key = self._title_key(item.title)
+                    if key in self._titles:
+                        continue
+                    self._titles.add(key)
+                    item = self._renumber(item)
+
+                item.save(self.path)
+                saved_ids.append(provider_id)
+                self.latest = max(self.latest, item.published)
+
+            except (OSError, ValueError) as e:
+                logger.warning(f'Cannot save publication:{item.title}: {e}')
+                self.errors += 1
+                continue
+
+        if checkpoint is not None:
+            checkpoint.record(page.query.start_index, page.total, saved_ids, page.next_cursor)
+        self.saved += len(saved_ids)
+        return len(saved_ids)
+
+    def close(self) -> None:
+        if self.enriched > 0:
+            print(f'{self.enriched} missing abstracts backfilled from other providers')
+            logger.info(f'{self.path}: {self.enriched} abstracts backfilled')
+        if self.cache_hits > 0:
+            print(f'{self.cache_hits} pages served from cache')
+            logger.info(f'{self.path}: {self.cache_hits} pages served from cache')
+        print(
+            f'Finished: Saved {self.saved} files to [green]{self.path}[/green] '
+            f'([red]{self.errors}[/red] not saved)'
+        )
+        logger.info(f'Finished: Saved {self.saved} files to {self.path} ({self.errors} not saved)')
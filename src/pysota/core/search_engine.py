@@ -1,14 +1,88 @@
+import math
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from pathlib import Path
+from typing import TypeVar
+
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from rich import print
 from rich.progress import Progress, TaskID
 
-from pysota.core import Provider, ResultPage
+from pysota.core import (
+    AbstractEnricher,
+    BatchQuery,
+    BatchStats,
+    HarvestCheckpoint,
+    HttpTransport,
+    IQuery,
+    PayloadArchive,
+    Provider,
+    Publication,
+    QueryPlanner,
+    ResponseCache,
+    ResultPage,
+    ResultSink,
+    Watermarks,
+    YieldScheduler,
+    YieldTracker,
+)
+
+T = TypeVar('T')
+
+# seconds a provider past its deadline is given to hand back the pages it downloaded
+GRACE = 1.0
 
 
 class SearchEngine(BaseModel):
     verbose: bool
     providers: list[Provider]
+    concurrent: bool = False
+    max_workers: int | None = None
+    # seconds a search may take overall, providers still running then are left out
+    deadline: float | None = Field(default=None, gt=0)
+    transport: HttpTransport = Field(default_factory=HttpTransport)
+    cache: ResponseCache | None = None
+    # keeps the raw responses of every search, to be replayed without the network
+    archive: PayloadArchive | None = None
+    # backfills missing abstracts of harvested pages before they are validated
+    enricher: AbstractEnricher | None = None
+    # new publications per request of every provider, by query, see `search_budget`
+    yields: YieldTracker = Field(default_factory=YieldTracker)
+
+    def model_post_init(self, context, /) -> None:
+        self._attach()
+
+    def _attach(self) -> None:
+        # every provider shares the engine connection pools, response cache and archive
+        lookups = self.enricher.providers if self.enricher is not None else []
+        for provider in [*self.providers, *lookups]:
+            provider.transport = self.transport
+            provider.cache = self.cache
+            provider.archive = self.archive
+
+    def use_cache(self, cache: ResponseCache | None) -> None:
+        self.cache = cache
+        self._attach()
+
+    def use_archive(self, archive: PayloadArchive | None) -> None:
+        self.archive = archive
+        self._attach()
+
+    def use_providers(self, providers: list[Provider]) -> None:
+        self.providers = providers
+        self._attach()
+
+    def use_enricher(self, enricher: AbstractEnricher | None) -> None:
+        self.enricher = enricher
+        self._attach()
+
+    @property
+    def enrich(self) -> Callable[[list[Publication]], int] | None:
+        return self.enricher.enrich if self.enricher is not None else None
 
     def search(
         self,
@@ -21,10 +95,435 @@ class SearchEngine(BaseModel):
         task_id: TaskID,
         progress: Progress,
     ) -> dict[str, ResultPage]:
-        results: dict[str, ResultPage] = {}
+        """
+        Search every provider, returning a page of results per provider.
+
+        The search is bounded by the engine `deadline` and by each provider `timeout`, both
+        counted from now: a provider past its limit is left out of the results, or with `all`
+        returns the pages it downloaded so far (marked `partial`). Providers whose circuit
+        breaker is open are skipped.
+        """
+        start = time.monotonic()
+        jobs: dict[str, Callable[[], ResultPage]] = {}
+        cutoffs: dict[str, float] = {}
+        for provider in self.providers:
+            limits = [t for t in (self.deadline, provider.timeout) if t is not None]
+            cutoff = start + min(limits) if limits else None
+            query = provider.make_query(name, include, exclude, num_items, offset)
+            if all:
+                jobs[provider.name] = partial(provider.search_all, query, cutoff)
+            else:
+                jobs[provider.name] = partial(provider.search_until, query, cutoff)
+            if cutoff is not None:
+                # with `all` the provider stops paging at the cutoff by itself
+                cutoffs[provider.name] = cutoff + GRACE if all else cutoff
+        return self._dispatch(jobs, task_id, progress, cutoffs)
+
+    def search_budget(
+        self,
+        name: str,
+        include: list[str],
+        exclude: list[str],
+        num_items: int,
+        offset: int,
+        budget: int,
+        task_id: TaskID,
+        progress: Progress,
+    ) -> dict[str, ResultPage]:
+        """
+        Search every provider within a budget of `budget` requests, favouring high yields.
+
+        The requests left after the first page of each provider go to the providers that
+        bring the most unique, valid new publications per request (see `YieldScheduler`), so
+        the budget buys as large a deduplicated corpus as it can. The page returned for each
+        provider only holds the new publications it brought. Providers whose circuit breaker
+        is open are skipped, and every request counts towards the breaker of its provider.
+        """
+        jobs = {}
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                print(f'[yellow]Skipped[/yellow]: [cyan]{provider.name}[/cyan] keeps failing')
+                logger.warning(f'Skipping {provider.name}: circuit open')
+                continue
+            query = provider.make_query(name, include, exclude, num_items, offset)
+            jobs[provider.name] = (provider, provider.harvest_query(query))
+        progress.update(task_id, total=budget)
+        print(f'\n>Searching with a budget of {budget} requests')
+        logger.info(f'Budgeted search of {name}: {budget} requests')
+
+        scheduler = YieldScheduler(budget=budget, max_workers=self.max_workers)
+        results = scheduler.run(
+            jobs, self.yields, name, lambda: progress.advance(task_id), self._record
+        )
+        self.yields.report(name)
+        return results
+
+    def search_batch(
+        self, queries: list[BatchQuery], task_id: TaskID, progress: Progress
+    ) -> tuple[dict[str, dict[str, ResultPage]], BatchStats]:
+        """
+        Search many queries at once, returning their pages by query and provider name.
+
+        Every query x provider job runs in one pool of `max_workers` workers (by default the
+        sum of the providers `max_concurrent`), while each provider keeps a single rate
+        limiter whatever the number of queries hitting it. Jobs sending the same request
+        (same provider and `generate_url()`) are searched once and the page is handed to every
+        query that asked for it. Providers whose circuit breaker is open are skipped.
+        """
+        by_name = {provider.name: provider for provider in self.providers}
+        searches: dict[tuple[str, str, bool], tuple[Provider, IQuery, bool]] = {}
+        wanted: list[tuple[BatchQuery, str, tuple[str, str, bool]]] = []
+        for batch_query in queries:
+            for provider_name in batch_query.providers or list(by_name):
+                if provider_name not in by_name:
+                    raise ValueError(f'{batch_query.name}: unknown provider {provider_name}')
+                provider = by_name[provider_name]
+                query = provider.make_query(
+                    batch_query.name,
+                    batch_query.include,
+                    batch_query.exclude,
+                    batch_query.num_items,
+                    batch_query.offset,
+                )
+                request = provider.harvest_query(query) if batch_query.all else query
+                key = (provider_name, request.generate_url(), batch_query.all)
+                searches.setdefault(key, (provider, query, batch_query.all))
+                wanted.append((batch_query, provider_name, key))
+
+        stats = BatchStats(jobs=len(wanted), requests=len(searches))
+        progress.update(task_id, total=len(searches))
+        print(f'\n>Searching {len(searches)} distinct requests for {len(wanted)} jobs')
+        logger.info(f'Batch: {len(searches)} distinct requests for {len(wanted)} jobs')
+
+        def run(provider: Provider, query: IQuery, all: bool) -> ResultPage | None:
+            if not provider.breaker.allow():
+                return None
+            try:
+                page = provider.search_all(query) if all else provider.search(query)
+            except Exception:
+                provider.breaker.record_failure()
+                raise
+            provider.breaker.record_success()
+            return page
+
+        start = time.monotonic()
+        pages: dict[tuple[str, str, bool], ResultPage] = {}
+        workers = self.max_workers or sum(p.rate_limit.max_concurrent for p in self.providers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pysota-batch') as pool:
+            futures = {pool.submit(run, *search): key for key, search in searches.items()}
+            for future in as_completed(futures):
+                provider_name, url, _ = futures[future]
+                error = future.exception()
+                if error is not None:
+                    stats.failed += 1
+                    print(f'[red]Failed[/red]: [cyan]{provider_name}[/cyan] {url}\n{error}')
+                    logger.opt(exception=error).error(f'Batch: {provider_name} {url} failed')
+                else:
+                    page = future.result()
+                    if page is None:
+                        stats.skipped += 1
+                        logger.warning(f'Batch: skipped {provider_name} {url}, circuit open')
+                    else:
+                        pages[futures[future]] = page
+                        stats.publications += page.num_items
+                        stats.cache_hits += page.cache_hits
+                        count = stats.per_provider.get(provider_name, 0) + page.num_items
+                        stats.per_provider[provider_name] = count
+                progress.advance(task_id)
+        stats.elapsed = time.monotonic() - start
+
+        results: dict[str, dict[str, ResultPage]] = {}
+        for batch_query, provider_name, key in wanted:
+            if key not in pages:
+                continue
+            page = pages[key]
+            if page.query.name != batch_query.name:
+                # a request shared with another query, its publications are relabelled
+                page = page.model_copy(
+                    update={
+                        'query': page.query.model_copy(update={'name': batch_query.name}),
+                        'items': [
+                            item.model_copy(update={'query_name': batch_query.name})
+                            for item in page.items
+                        ],
+                    }
+                )
+            results.setdefault(batch_query.name, {})[provider_name] = page
+        return results, stats
+
+    def harvest(
+        self,
+        name: str,
+        include: list[str],
+        exclude: list[str],
+        num_items: int,
+        offset: int,
+        results_dir: Path,
+        task_id: TaskID,
+        progress: Progress,
+        resume: bool = True,
+        delta: bool = False,
+        shard: bool = False,
+    ) -> dict[str, ResultSink]:
+        """
+        Download every page of the query and persist each one as soon as it arrives.
+
+        Pages go straight from the providers into a `ResultSink` under
+        `results_dir/<name>/<provider>`, so memory is bounded by the page size (times the
+        provider prefetch) instead of growing with the whole harvest. Progress is checkpointed
+        in the same folder; with `resume` a rerun only downloads the pages still missing,
+        otherwise the harvest starts over.
+
+        Every harvest moves the per-provider watermark of the query forward to the latest
+        publication date it saved. With `delta`, providers are only asked for publications
+        from their watermark on and the new ones are merged into the existing results.
+
+        With an `enricher`, missing abstracts are backfilled before each page is validated.
+
+        With `shard`, queries too large to be paged through by a provider are split into date
+        ranges (see `QueryPlanner`) harvested in parallel and merged into the same folder.
+
+        Past the engine `deadline` every provider stops paging, the pages saved so far are
+        kept and the checkpoint is left incomplete, for a later run to resume.
+        """
+        watermarks = Watermarks.load(results_dir.joinpath(name))
+        cutoff = time.monotonic() + self.deadline if self.deadline is not None else None
+        jobs = {}
+        for provider in self.providers:
+            query = provider.make_query(name, include, exclude, num_items, offset)
+            query = provider.harvest_query(query)
+            if delta:
+                query = query.newer_than(watermarks.get(provider.name))
+                print(f'[cyan]{provider.name}[/cyan]: fetching publications since {query.since}')
+                logger.info(f'{provider.name}: delta harvest since {query.since}')
+            path = results_dir.joinpath(name).joinpath(provider.name)
+            if shard and provider.max_depth is not None and query.cursor is None:
+                jobs[provider.name] = partial(
+                    self._harvest_shards,
+                    provider,
+                    query,
+                    path,
+                    watermarks,
+                    progress,
+                    resume,
+                    cutoff,
+                )
+                continue
+            checkpoint = HarvestCheckpoint.load(path, query.generate_url())
+            if not resume:
+                checkpoint.reset()
+            elif checkpoint.complete:
+                print(f'[cyan]{provider.name}[/cyan]: harvest already complete in {path}')
+                logger.info(f'{provider.name}: harvest already complete in {path}')
+                progress.advance(task_id)
+                continue
+            sink = ResultSink(path=path, checkpoint=checkpoint, merge=delta, enrich=self.enrich)
+            jobs[provider.name] = partial(
+                self._harvest_provider, provider, query, sink, watermarks, progress, cutoff
+            )
+        cutoffs = dict.fromkeys(jobs, cutoff + GRACE) if cutoff is not None else None
+        return self._dispatch(jobs, task_id, progress, cutoffs)
+
+    def _harvest_provider(
+        self,
+        provider: Provider,
+        query: IQuery,
+        sink: ResultSink,
+        watermarks: Watermarks,
+        progress: Progress,
+        deadline: float | None = None,
+    ) -> ResultSink:
+        page_task = progress.add_task(f'{provider.name} pages', total=None)
+        sized = False
+        for page in provider.iter_pages(query, sink.checkpoint, deadline):
+            if not sized and page.items_per_page > 0:
+                pages = math.ceil(max(page.total - page.start_index, 0) / page.items_per_page)
+                progress.update(page_task, total=max(pages, 1))
+                sized = True
+            saved = sink.write(page)
+            logger.info(f'{provider.name}: page at {page.start_index} saved {saved} files')
+            progress.advance(page_task)
+        sink.close()
+        watermarks.update(provider.name, sink.latest)
+        return sink
+
+    def _harvest_shards(
+        self,
+        provider: Provider,
+        query: IQuery,
+        path: Path,
+        watermarks: Watermarks,
+        progress: Progress,
+        resume: bool,
+        deadline: float | None = None,
+    ) -> ResultSink:
+        """
+        Harvest the date shards of a query in parallel into one merging sink.
+
+        Each shard keeps its own checkpoint under `path/_shards`; the sink drops publications
+        already saved by another shard (matched by title) and numbers them in arrival order.
+        """
+        workers = provider.rate_limit.max_concurrent
+        shards = QueryPlanner(max_workers=workers).plan(provider, query)
+        sink = ResultSink(path=path, merge=True, enrich=self.enrich)
+        shard_task = progress.add_task(f'{provider.name} shards', total=len(shards))
+
+        def harvest_shard(shard: IQuery) -> None:
+            label = f'{shard.since}_{shard.until}' if shard.dated else 'all'
+            folder = path.joinpath('_shards', label)
+            checkpoint = HarvestCheckpoint.load(folder, shard.generate_url())
+            if not resume:
+                checkpoint.reset()
+            elif checkpoint.complete:
+                return
+            for page in provider.iter_pages(shard, checkpoint, deadline):
+                saved = sink.write(page, checkpoint)
+                logger.info(f'{provider.name}: {label} page at {page.start_index} saved {saved}')
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=f'pysota-shards-{provider.name}'
+        ) as pool:
+            futures = {pool.submit(harvest_shard, shard): shard for shard in shards}
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    shard = futures[future]
+                    label = f'{provider.name} {shard.since}..{shard.until}'
+                    print(f'[red]Caught![/red] {label}: {error}')
+                    logger.opt(exception=error).error(f'{label}: shard failed')
+                progress.advance(shard_task)
+        sink.close()
+        watermarks.update(provider.name, sink.latest)
+        return sink
+
+    def _admit(
+        self, jobs: dict[str, Callable[[], T]], task_id: TaskID, progress: Progress
+    ) -> dict[str, Callable[[], T]]:
+        """Jobs of the providers whose circuit breaker lets them through."""
+        breakers = {provider.name: provider.breaker for provider in self.providers}
+        admitted = {}
+        for provider_name, job in jobs.items():
+            breaker = breakers.get(provider_name)
+            if breaker is not None and not breaker.allow():
+                print(f'[yellow]Skipped[/yellow]: [cyan]{provider_name}[/cyan] keeps failing')
+                logger.warning(f'Skipping {provider_name}: circuit open')
+                progress.advance(task_id)
+                continue
+            admitted[provider_name] = job
+        return admitted
+
+    def _record(self, provider_name: str, success: bool) -> None:
         for provider in self.providers:
-            print(f'\n>Querying [cyan]{provider.name}[/cyan]')
-            logger.info(f'Querying: {provider.name}')
-            results[provider.name] = provider.search(name, include, exclude, num_items, offset, all)
+            if provider.name == provider_name:
+                if success:
+                    provider.breaker.record_success()
+                else:
+                    provider.breaker.record_failure()
+
+    def _dispatch(
+        self,
+        jobs: dict[str, Callable[[], T]],
+        task_id: TaskID,
+        progress: Progress,
+        cutoffs: dict[str, float] | None = None,
+    ) -> dict[str, T]:
+        """
+        Run one job per provider, one after another or all at once when `concurrent`.
+
+        Jobs with a cutoff (a `time.monotonic()` value) always run at once, so that a provider
+        that hangs cannot hold back the others.
+        """
+        jobs = self._admit(jobs, task_id, progress)
+        if self.concurrent or cutoffs:
+            return self._dispatch_concurrent(jobs, task_id, progress, cutoffs or {})
+
+        results: dict[str, T] = {}
+        for provider_name, job in jobs.items():
+            print(f'\n>Querying [cyan]{provider_name}[/cyan]')
+            logger.info(f'Querying: {provider_name}')
+            try:
+                results[provider_name] = job()
+            except Exception:
+                self._record(provider_name, success=False)
+                raise
+            self._record(provider_name, success=True)
             progress.advance(task_id)
         return results
+
+    def _dispatch_concurrent(
+        self,
+        jobs: dict[str, Callable[[], T]],
+        task_id: TaskID,
+        progress: Progress,
+        cutoffs: dict[str, float] | None = None,
+    ) -> dict[str, T]:
+        """
+        Dispatch every provider at once and merge the results as they complete.
+
+        A provider that raises, or is still running at its cutoff, is logged and left out of
+        the results, the others carry on; either counts as a failure for its circuit breaker.
+        Providers left running are not waited for, they run in daemon threads so that they
+        cannot hold back the exit of the process either. The returned mapping keeps the order
+        of `jobs`.
+        """
+        if not jobs:
+            return {}
+        cutoffs = cutoffs or {}
+        slots = threading.BoundedSemaphore(self.max_workers or len(jobs))
+        results: dict[str, T] = {}
+
+        def start(job: Callable[[], T]) -> Future[T]:
+            future: Future[T] = Future()
+
+            def run() -> None:
+                with slots:
+                    if not future.set_running_or_notify_cancel():
+                        return
+                    # whatever the job raises is handed to the future, as an executor does
+                    try:
+                        future.set_result(job())
+                    except Exception as e:  # noqa: BLE001
+                        future.set_exception(e)
+
+            threading.Thread(target=run, name='pysota-search', daemon=True).start()
+            return future
+
+        futures: dict[Future[T], str] = {}
+        try:
+            for provider_name, job in jobs.items():
+                print(f'\n>Querying [cyan]{provider_name}[/cyan]')
+                logger.info(f'Querying: {provider_name}')
+                futures[start(job)] = provider_name
+
+            pending = set(futures)
+            while pending:
+                limits = [cutoffs[futures[f]] for f in pending if futures[f] in cutoffs]
+                timeout = max(min(limits) - time.monotonic(), 0) if limits else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider_name = futures[future]
+                    error = future.exception()
+                    if error is None:
+                        results[provider_name] = future.result()
+                        self._record(provider_name, success=True)
+                        print(f'[green]Done[/green]: [cyan]{provider_name}[/cyan]')
+                        logger.info(f'Finished: {provider_name}')
+                    else:
+                        self._record(provider_name, success=False)
+                        print(f'[red]Failed[/red]: [cyan]{provider_name}[/cyan]\n{error}')
+                        logger.opt(exception=error).error(f'Provider {provider_name} failed')
+                    progress.advance(task_id)
+
+                now = time.monotonic()
+                for future in [f for f in pending if cutoffs.get(futures[f], math.inf) <= now]:
+                    provider_name = futures[future]
+                    pending.remove(future)
+                    self._record(provider_name, success=False)
+                    print(f'[yellow]Timed out[/yellow]: [cyan]{provider_name}[/cyan]')
+                    logger.warning(f'Provider {provider_name} timed out, leaving it out')
+                    progress.advance(task_id)
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return {name: results[name] for name in jobs if name in results}
@@ -0,0 +1,540 @@
+import os
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import ClassVar
+
+import yaml
+from loguru import logger
+from omegaconf import OmegaConf
+from pydantic import BaseModel, Field
+from rich import print
+
+from pysota.core import Publication
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+
+class StorageBackend(BaseModel, ABC):
+    """
+    On-disk format of a DB of publications, behind `Persistence`.
+
+    A DB is a folder; `load` reads every DB found under `path/query_name`, so a folder holding
+    several DBs (e.g. the queries of `results/raw`) loads as one.
+    """
+
+    format: ClassVar[str]
+
+    @abstractmethod
+    def holds(self, path: Path) -> bool:
+        """Whether `path` holds a DB in this format."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, path: Path, query_name: str = '') -> list[Publication]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, db: list[Publication], path: Path) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_by_name(self, path: Path, name: str) -> Publication | None:
+        raise NotImplementedError
+
+    def load_many(self, path: Path, names: list[str]) -> list[Publication | None]:
+        """Publications by id, aligned with `names`, None for the ones not found."""
+        return [self.load_by_name(path, name) for name in names]
+
+
+def load_yaml_files(files: list[tuple[Path, bool]]) -> list[tuple[Publication | None, str]]:
+    """
+    Publications of `files`, given with whether they are trusted, or None and the error for
+    the ones that cannot be loaded.
+    """
+    loaded = []
+    for file, trusted in files:
+        try:
+            loaded.append((YamlStorage.publication_factory(file, trusted), ''))
+        except (OSError, TypeError, ValueError, yaml.YAMLError) as e:
+            loaded.append((None, str(e)))
+    return loaded
+
+
+class YamlStorage(StorageBackend):
+    """
+    One OmegaConf YAML file per publication, named after its id, and an `_index.yaml`.
+
+    The format the providers save their results in, and the import/export format of the DBs.
+
+    Files are parsed with the libyaml loader. Large folders are loaded by `workers` processes
+    (one per core by default), `chunk_size` files at a time; the publications come back sorted
+    by file path whatever the number of workers.
+
+    `save` stamps the `_index.yaml` of a DB with `Publication.schema_version`. The publications
+    of a folder stamped with the current version are trusted (`Publication.trusted`) rather
+    than validated; drop the stamp from a DB edited by hand.
+    """
+
+    format: ClassVar[str] = 'yaml'
+    stamp: ClassVar[str] = '_schema_version'
+
+    workers: int | None = Field(default=None, ge=1)
+    chunk_size: int = Field(default=500, ge=1)
+
+    @staticmethod
+    def publication_factory(file: Path, trusted: bool = False) -> Publication:
+        with open(file, 'rb') as f:
+            fields = yaml.load(f, Loader=SafeLoader)
+        return Publication.trusted(fields) if trusted else Publication(**fields)
+
+    def holds(self, path: Path) -> bool:
+        return any(path.glob('*.yaml'))
+
+    def trusted(self, path: Path) -> bool:
+        """Whether the DB at `path` was saved with the current publication layout."""
+        index_path = path.joinpath('_index.yaml')
+        if not index_path.exists():
+            return False
+        with open(index_path, 'rb') as f:
+            # the stamp is the first line, the rest of the index need not be parsed
+            line = f.readline()
+        try:
+            first = yaml.load(line, Loader=SafeLoader)
+        except yaml.YAMLError:
+            # an unstamped index, whose first entry does not fit on its line
+            return False
+        return isinstance(first, dict) and first.get(self.stamp) == Publication.schema_version
+
+    def load(self, path: Path, query_name: str = '') -> list[Publication]:
+        files = []
+        for file in sorted(path.joinpath(query_name).glob('**/*.yaml')):
+            # _index.yaml, _checkpoint.yaml, ... are bookkeeping files, not publications
+            if file.name.startswith('_'):
+                print(f'[yellow]skipping:[/yellow] {file.name}')
+                continue
+            files.append(file)
+
+        folders = {folder: self.trusted(folder) for folder in {file.parent for file in files}}
+        logger.debug(f'Trusted folders: {[str(f) for f, trusted in folders.items() if trusted]}')
+        tasks = [(file, folders[file.parent]) for file in files]
+        chunks = [tasks[i : i + self.chunk_size] for i in range(0, len(tasks), self.chunk_size)]
+        workers = min(self.workers or os.cpu_count() or 1, len(chunks))
+        if workers > 1:
+            logger.debug(f'Loading {len(files)} files with {workers} processes')
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                loaded = list(pool.map(load_yaml_files, chunks))
+        else:
+            loaded = [load_yaml_files(chunk) for chunk in chunks]
+
+        db = []
+        for chunk, results in zip(chunks, loaded):
+            for (file, _), (publication, error) in zip(chunk, results):
+                if publication is None:
+                    print(f'[red]Caught![/red]:{file.name}\n{error}')
+                    continue
+                db.append(publication)
+        return db
+
+    def save(self, db: list[Publication], path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        index: dict = {self.stamp: Publication.schema_version}
+        for i in db:
+            i.save(path)
+            index[i.id] = i.title
+        index_dump = OmegaConf.create(index)
+        index_path = path.joinpath('_index.yaml')
+        index_path.touch()
+        with index_path as f:
+            OmegaConf.save(index_dump, f)
+
+    def load_by_name(self, path: Path, name: str) -> Publication | None:
+        file_path = path.joinpath(f'{name}.yaml')
+        if not file_path.exists():
+            print(f'Target file not found: [red]{file_path}[/red]')
+            return None
+        return self.publication_factory(file_path, self.trusted(path))
+
+
+class ParquetStorage(StorageBackend):
+    """
+    Whole DB in a single columnar file, `publications.parquet`, one row per publication.
+
+    Loading a DB is one sequential read instead of a file open and YAML parse per publication.
+    Needs pyarrow, from the `parquet` extra (`pip install pysota[parquet]`), which is only
+    imported when the format is used.
+    Files stamped with the current `Publication.schema_version` in their metadata are trusted.
+    """
+
+    format: ClassVar[str] = 'parquet'
+    file_name: ClassVar[str] = 'publications.parquet'
+    stamp: ClassVar[bytes] = b'pysota_schema_version'
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            message = 'The parquet storage needs pyarrow: pip install pysota[parquet]'
+            raise ImportError(message) from e
+        return pa, pq
+
+    @classmethod
+    def schema(cls):
+        pa, _ = cls._pyarrow()
+        return pa.schema(
+            [
+                ('id', pa.string()),
+                ('title', pa.string()),
+                ('year', pa.int64()),
+                ('authors', pa.list_(pa.string())),
+                ('internal_index', pa.int64()),
+                ('provider_name', pa.string()),
+                ('query_name', pa.string()),
+                ('abstract', pa.string()),
+                ('published', pa.string()),
+                ('doi', pa.string()),
+            ]
+        )
+
+    def holds(self, path: Path) -> bool:
+        # the DB itself, or a folder of DBs
+        return path.joinpath(self.file_name).exists() or any(path.glob(f'*/{self.file_name}'))
+
+    def _rows(self, file: Path, filters=None) -> list[Publication]:
+        _, pq = self._pyarrow()
+        table = pq.read_table(file, filters=filters)
+        stamp = (table.schema.metadata or {}).get(self.stamp)
+        if stamp == str(Publication.schema_version).encode():
+            columns = table.to_pydict()
+            return [
+                Publication.trusted(dict(zip(columns, values))) for values in zip(*columns.values())
+            ]
+        db = []
+        for row in table.to_pylist():
+            try:
+                db.append(Publication(**row))
+            except (TypeError, ValueError) as e:
+                print(f'[red]Caught![/red]:{file}:{row.get("id")}\n{e}')
+        return db
+
+    def load(self, path: Path, query_name: str = '') -> list[Publication]:
+        root = path.joinpath(query_name)
+        own = root.joinpath(self.file_name)
+        files = ([own] if own.exists() else []) + sorted(root.glob(f'**/*/{self.file_name}'))
+        db = []
+        for file in files:
+            db.extend(self._rows(file))
+        return db
+
+    def save(self, db: list[Publication], path: Path) -> None:
+        pa, pq = self._pyarrow()
+        path.mkdir(parents=True, exist_ok=True)
+        rows = []
+        for pub in db:
+            # cleaned as `Publication.save` does for the YAML files
+            pub.abstract = pub.clean_text(pub.abstract)
+            pub.title = pub.clean_text(pub.title)
+            rows.append(pub.model_dump())
+        table = pa.Table.from_pylist(rows, schema=self.schema())
+        table = table.replace_schema_metadata({self.stamp: str(Publication.schema_version)})
+        target = path.joinpath(self.file_name)
+        tmp = target.with_suffix(f'.{os.getpid()}.tmp')
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, target)
+        logger.debug(f'Saved {len(rows)} publications to {target}')
+
+    def load_by_name(self, path: Path, name: str) -> Publication | None:
+        file_path = path.joinpath(self.file_name)
+        if not file_path.exists():
+            print(f'Target file not found: [red]{file_path}[/red]')
+            return None
+        found = self._rows(file_path, filters=[('id', '==', name)])
+        if not found:
+            print(f'Target publication not found: [red]{name}[/red] in {file_path}')
+            return None
+        return found[0]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS publications (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    internal_index INTEGER NOT NULL,
+    provider_name TEXT NOT NULL,
+    query_name TEXT NOT NULL REFERENCES queries (name),
+    abstract TEXT NOT NULL,
+    published TEXT NOT NULL DEFAULT '',
+    doi TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS publications_provider ON publications (provider_name);
+CREATE INDEX IF NOT EXISTS publications_query ON publications (query_name);
+CREATE INDEX IF NOT EXISTS publications_year ON publications (year);
+CREATE TABLE IF NOT EXISTS authors (
+    publication_id TEXT NOT NULL REFERENCES publications (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (publication_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS authors_name ON authors (name);
+CREATE TABLE IF NOT EXISTS clusters (
+    clustering TEXT NOT NULL,
+    publication_id TEXT NOT NULL REFERENCES publications (id) ON DELETE CASCADE,
+    cluster INTEGER NOT NULL,
+    PRIMARY KEY (clustering, publication_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS clusters_cluster ON clusters (clustering, cluster);
+"""
+# full-text index of titles and abstracts, kept in sync with the publications by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS publications_fts USING fts5 (
+    title, abstract, content = 'publications', content_rowid = 'rowid',
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS publications_fts_insert AFTER INSERT ON publications BEGIN
+    INSERT INTO publications_fts (rowid, title, abstract)
+    VALUES (new.rowid, new.title, new.abstract);
+END;
+CREATE TRIGGER IF NOT EXISTS publications_fts_delete AFTER DELETE ON publications BEGIN
+    INSERT INTO publications_fts (publications_fts, rowid, title, abstract)
+    VALUES ('delete', old.rowid, old.title, old.abstract);
+END;
+CREATE TRIGGER IF NOT EXISTS publications_fts_update AFTER UPDATE ON publications BEGIN
+    INSERT INTO publications_fts (publications_fts, rowid, title, abstract)
+    VALUES ('delete', old.rowid, old.title, old.abstract);
+    INSERT INTO publications_fts (rowid, title, abstract)
+    VALUES (new.rowid, new.title, new.abstract);
+END;
+"""
+COLUMNS = (
+    'id',
+    'title',
+    'year',
+    'internal_index',
+    'provider_name',
+    'query_name',
+    'abstract',
+    'published',
+    'doi',
+)
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Embedded SQLite DB, `publications.db`: publications, their authors, the queries they come
+    from and the cluster assignments made on them.
+
+    Publications are indexed by id, provider, query and year, so looking one up (`load_by_name`,
+    `load_many`) or scanning a filtered subset (`select`) reads a B-tree instead of the whole DB.
+    Saves are a single transaction. Titles and abstracts are also indexed for full-text search
+    (`search`, SQLite FTS5), updated with every save. Saves stamp the DB `user_version` with
+    `Publication.schema_version`; the publications of a DB with the current stamp are trusted.
+    """
+
+    format: ClassVar[str] = 'sqlite'
+    file_name: ClassVar[str] = 'publications.db'
+    # ids bound per lookup statement, within the SQLite variable limit
+    chunk_size: ClassVar[int] = 500
+
+    def holds(self, path: Path) -> bool:
+        # the DB itself, or a folder of DBs
+        return path.joinpath(self.file_name).exists() or any(path.glob(f'*/{self.file_name}'))
+
+    def connect(self, path: Path) -> sqlite3.Connection:
+        path.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path.joinpath(self.file_name))
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.executescript(SCHEMA)
+        indexed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'publications_fts'"
+        ).fetchone()
+        if not indexed:
+            try:
+                with conn:
+                    conn.executescript(FTS_SCHEMA)
+                    # publications saved before the index existed
+                    conn.execute(
+                        "INSERT INTO publications_fts (publications_fts) VALUES ('rebuild')"
+                    )
+            except sqlite3.OperationalError as e:
+                logger.warning(f'No full-text index in {path}, SQLite lacks FTS5: {e}')
+        return conn
+
+    def _publications(
+        self, conn: sqlite3.Connection, where: str = '', params=()
+    ) -> list[Publication]:
+        rows = conn.execute(
+            f'SELECT {", ".join(COLUMNS)} FROM publications {where} ORDER BY id', params
+        ).fetchall()
+        authors: dict[str, list[str]] = {}
+        author_rows = conn.execute(
+            'SELECT publication_id, name FROM authors '
+            f'WHERE publication_id IN (SELECT id FROM publications {where}) '
+            'ORDER BY publication_id, position',
+            params,
+        )
+        for publication_id, name in author_rows:
+            authors.setdefault(publication_id, []).append(name)
+        if conn.execute('PRAGMA user_version').fetchone()[0] == Publication.schema_version:
+            return [
+                Publication.trusted({**dict(zip(COLUMNS, row)), 'authors': authors.get(row[0], [])})
+                for row in rows
+            ]
+        db = []
+        for row in rows:
+            fields = dict(zip(COLUMNS, row))
+            try:
+                db.append(Publication(**fields, authors=authors.get(fields['id'], [])))
+            except (TypeError, ValueError) as e:
+                print(f'[red]Caught![/red]:{fields["id"]}\n{e}')
+        return db
+
+    def load(self, path: Path, query_name: str = '') -> list[Publication]:
+        root = path.joinpath(query_name)
+        own = root.joinpath(self.file_name)
+        files = ([own] if own.exists() else []) + sorted(root.glob(f'**/*/{self.file_name}'))
+        db = []
+        for file in files:
+            with closing(self.connect(file.parent)) as conn:
+                db.extend(self._publications(conn))
+        return db
+
+    def select(
+        self,
+        path: Path,
+        query_name: str | None = None,
+        provider: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+    ) -> list[Publication]:
+        """Publications of the DB at `path` from a query, a provider or a range of years."""
+        clauses, params = [], []
+        for clause, value in (
+            ('query_name = ?', query_name),
+            ('provider_name = ?', provider),
+            ('year >= ?', since),
+            ('year <= ?', until),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        with closing(self.connect(path)) as conn:
+            return self._publications(conn, where, params)
+
+    def save(self, db: list[Publication], path: Path) -> None:
+        rows, authors = [], []
+        for pub in db:
+            # cleaned as `Publication.save` does for the YAML files
+            pub.abstract = pub.clean_text(pub.abstract)
+            pub.title = pub.clean_text(pub.title)
+            rows.append(tuple(getattr(pub, column) for column in COLUMNS))
+            authors.extend((pub.id, i, name) for i, name in enumerate(pub.authors))
+        with closing(self.connect(path)) as conn, conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO queries (name) VALUES (?)',
+                [(name,) for name in {pub.query_name for pub in db}],
+            )
+            conn.executemany(
+                'DELETE FROM authors WHERE publication_id = ?', [(row[0],) for row in rows]
+            )
+            conn.executemany(
+                f'INSERT INTO publications ({", ".join(COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(COLUMNS))}) '
+                f'ON CONFLICT (id) DO UPDATE SET '
+                + ', '.join(f'{column} = excluded.{column}' for column in COLUMNS[1:]),
+                rows,
+            )
+            conn.executemany(
+                'INSERT INTO authors (publication_id, position, name) VALUES (?, ?, ?)', authors
+            )
+            conn.execute(f'PRAGMA user_version = {Publication.schema_version}')
+        logger.debug(f'Saved {len(rows)} publications to {path.joinpath(self.file_name)}')
+
+    def load_many(self, path: Path, names: list[str]) -> list[Publication | None]:
+        if not path.joinpath(self.file_name).exists():
+            print(f'Target file not found: [red]{path.joinpath(self.file_name)}[/red]')
+            return [None] * len(names)
+        found: dict[str, Publication] = {}
+        with closing(self.connect(path)) as conn:
+            for start in range(0, len(names), self.chunk_size):
+                chunk = names[start : start + self.chunk_size]
+                where = f'WHERE id IN ({", ".join("?" * len(chunk))})'
+                found.update((pub.id, pub) for pub in self._publications(conn, where, chunk))
+        return [found.get(name) for name in names]
+
+    def load_by_name(self, path: Path, name: str) -> Publication | None:
+        pub = self.load_many(path, [name])[0]
+        if pub is None:
+            print(f'Target publication not found: [red]{name}[/red] in {path}')
+        return pub
+
+    def save_clusters(self, path: Path, clustering: str, mapping: dict[str, int]) -> None:
+        """Record the cluster of every publication for `clustering`, replacing earlier ones."""
+        with closing(self.connect(path)) as conn, conn:
+            conn.execute('DELETE FROM clusters WHERE clustering = ?', (clustering,))
+            conn.executemany(
+                'INSERT INTO clusters (clustering, publication_id, cluster) VALUES (?, ?, ?)',
+                [(clustering, name, cluster) for name, cluster in mapping.items()],
+            )
+
+    def load_cluster(self, path: Path, clustering: str, cluster: int) -> list[Publication]:
+        where = (
+            'WHERE id IN (SELECT publication_id FROM clusters WHERE clustering = ? AND cluster = ?)'
+        )
+        with closing(self.connect(path)) as conn:
+            return self._publications(conn, where, (clustering, cluster))
+
+    @staticmethod
+    def match(text: str) -> str:
+        """FTS5 query matching all the words of `text`, whatever their punctuation."""
+        return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+    def search(
+        self,
+        path: Path,
+        text: str,
+        k: int = 10,
+        provider: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        raw: bool = False,
+    ) -> list[tuple[Publication, float]]:
+        """
+        Top `k` publications matching `text` in their title or abstract, best first, with their
+        BM25 score (higher is better, title matches weigh double).
+
+        `text` matches publications holding all its words, stemmed; with `raw`, it is an FTS5
+        query instead (`OR`, `NOT`, `"phrases"`, `prefix*`, `NEAR(...)`).
+        """
+        clauses, params = ['publications_fts MATCH ?'], [text if raw else self.match(text)]
+        for clause, value in (
+            ('p.provider_name = ?', provider),
+            ('p.year >= ?', since),
+            ('p.year <= ?', until),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        with closing(self.connect(path)) as conn:
+            ranked = conn.execute(
+                'SELECT p.id, bm25(publications_fts, 2.0, 1.0) AS rank FROM publications_fts '
+                'JOIN publications p ON p.rowid = publications_fts.rowid '
+                f'WHERE {" AND ".join(clauses)} ORDER BY rank LIMIT ?',
+                (*params, k),
+            ).fetchall()
+            if not ranked:
+                return []
+            where = f'WHERE id IN ({", ".join("?" * len(ranked))})'
+            found = {pub.id: pub for pub in self._publications(conn, where, [i for i, _ in ranked])}
+        return [(found[i], -rank) for i, rank in ranked if i in found]
@@ -0,0 +1,93 @@
+import random
+import threading
+from typing import ClassVar
+
+import requests
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+from requests.adapters import HTTPAdapter
+
+
+class HttpTransport(BaseModel):
+    """
+    Pooled HTTP session shared by the providers.
+
+    A single `requests.Session` keeps connections alive per host, so paginating through a
+    provider reuses the same TCP+TLS connection instead of a new handshake per page. Every
+    request gets connect/read timeouts and negotiates gzip/deflate compression. Requests failing
+    on a connection error or a 5xx answer are worth `retries` more attempts, `backoff` seconds
+    apart; the providers send them again themselves (see `Provider._send`), so that retries
+    keep to the rate limit and to the search deadline. 429 answers are left to the provider
+    `RateLimiter`, which needs to see them to slow down.
+
+    `redirects` maps URL prefixes to the ones requests are actually sent to, e.g. to point
+    the providers at a local stand-in server (see `benchmarks/fixture_server.py`).
+    """
+
+    connect_timeout: float = Field(default=5.0, gt=0)
+    read_timeout: float = Field(default=60.0, gt=0)
+    pool_connections: int = Field(default=16, ge=1)
+    pool_maxsize: int = Field(default=8, ge=1)
+    retries: int = Field(default=3, ge=0)
+    backoff_factor: float = Field(default=0.5, ge=0)
+    backoff_jitter: float = Field(default=0.5, ge=0)
+    user_agent: str = Field(default='pysota/0.1.0')
+    redirects: dict[str, str] = Field(default_factory=dict)
+
+    # answers worth retrying, 429 is not one of them
+    retry_statuses: ClassVar[frozenset[int]] = frozenset({500, 502, 503, 504})
+
+    _session: requests.Session | None = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before retry number `attempt` (from 1), exponential and jittered; the
+        first retry is sent right away, as urllib3 does.
+        """
+        if attempt <= 1:
+            return 0.0
+        return self.backoff_factor * 2 ** (attempt - 1) + random.uniform(0, self.backoff_jitter)
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self._build_session()
+            return self._session
+
+    def _build_session(self) -> requests.Session:
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Accept-Encoding': 'gzip, deflate', 'User-Agent': self.user_agent})
+        logger.debug(f'Created HTTP session: {self}')
+        return session
+
+    def target(self, url: str) -> str:
+        for prefix, replacement in self.redirects.items():
+            if url.startswith(prefix):
+                return replacement + url.removeprefix(prefix)
+        return url
+
+    def get(self, url: str, params: dict | None = None, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(self.target(url), params=params, **kwargs)
+
+    def post(self, url: str, params: dict | None = None, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(self.target(url), params=params, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
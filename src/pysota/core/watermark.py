@@ -0,0 +1,55 @@
+import os
+import threading
+from datetime import date
+from pathlib import Path
+from typing import ClassVar
+
+from omegaconf import OmegaConf
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class Watermarks(BaseModel):
+    """
+    Latest publication date harvested per provider for a query.
+
+    Stored in `_watermarks.yaml` in the results folder of the query, so the next run of the
+    same query only asks each provider for publications from that date on.
+    """
+
+    folder: Path = Field(exclude=True)
+    providers: dict[str, str] = Field(default={})
+
+    FILE: ClassVar[str] = '_watermarks.yaml'
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def path(self) -> Path:
+        return self.folder.joinpath(self.FILE)
+
+    @classmethod
+    def load(cls, folder: Path) -> 'Watermarks':
+        path = folder.joinpath(cls.FILE)
+        if not path.exists():
+            return cls(folder=folder)
+        stored = OmegaConf.to_container(OmegaConf.load(path), resolve=True)
+        return cls(folder=folder, **stored)  # type: ignore
+
+    def get(self, provider: str) -> date | None:
+        value = self.providers.get(provider)
+        return date.fromisoformat(value) if value else None
+
+    def update(self, provider: str, published: str) -> None:
+        """Move the watermark of `provider` forward to `published` (an ISO date) and save it."""
+        if not published:
+            return
+        # partial dates (YYYY or YYYY-MM) count from the start of the period
+        value = date.fromisoformat(f'{published}-01-01'[:10]).isoformat()
+        with self._lock:
+            if value <= self.providers.get(provider, ''):
+                return
+            self.providers[provider] = value
+            self.folder.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix('.tmp')
+            OmegaConf.save(OmegaConf.create(self.model_dump()), tmp)
+            os.replace(tmp, self.path)
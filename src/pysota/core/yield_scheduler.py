@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+from rich import print
+
+from pysota.core import IQuery, Publication, ResultPage
+
+if TYPE_CHECKING:
+    from pysota.core import Provider
+
+
+class ProviderYield(BaseModel):
+    """Requests sent to a provider for a query and the new publications they brought."""
+
+    requests: int = 0
+    items: int = 0
+    new: int = 0
+    # moving average of the new publications per request, later pages weigh more
+    score: float = 0.0
+
+
+class YieldTracker(BaseModel):
+    """
+    Yield of every provider, by query: unique, valid new publications per request.
+
+    A publication is new when neither its DOI nor its title has been seen for the query yet,
+    whichever provider returned it; invalid ones (`Publication.check_validity`) never are.
+    """
+
+    # weight of the latest request in the moving average
+    smoothing: float = Field(default=0.5, gt=0, le=1)
+    queries: dict[str, dict[str, ProviderYield]] = Field(default_factory=dict)
+
+    _seen: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @staticmethod
+    def _keys(item: Publication) -> list[str]:
+        keys = ['title:' + re.sub(r'\W+', '', item.title.lower())]
+        if item.doi:
+            keys.append(f'doi:{item.doi.lower()}')
+        return keys
+
+    def record(self, query_name: str, provider_name: str, page: ResultPage) -> list[Publication]:
+        """Account for a page of results, returning its new publications."""
+        with self._lock:
+            seen = self._seen.setdefault(query_name, set())
+            new = []
+            for item in page.items:
+                keys = self._keys(item)
+                if any(key in seen for key in keys) or not item.check_validity()[0]:
+                    continue
+                seen.update(keys)
+                new.append(item)
+
+            stats = self.queries.setdefault(query_name, {}).setdefault(
+                provider_name, ProviderYield()
+            )
+            stats.score = (
+                len(new)
+                if stats.requests == 0
+                else self.smoothing * len(new) + (1 - self.smoothing) * stats.score
+            )
+            stats.requests += 1
+            stats.items += len(page.items)
+            stats.new += len(new)
+            return new
+
+    def score(self, query_name: str, provider_name: str) -> float:
+        stats = self.queries.get(query_name, {}).get(provider_name)
+        return stats.score if stats is not None else float('inf')
+
+    def report(self, query_name: str) -> None:
+        for provider_name, stats in self.queries.get(query_name, {}).items():
+            summary = (
+                f'{stats.requests} requests, {stats.new} new of {stats.items} publications '
+                f'({stats.new / max(stats.requests, 1):.1f} per request)'
+            )
+            print(f'- [cyan]{provider_name}[/cyan]: {summary}')
+            logger.info(f'{query_name} {provider_name} yield: {summary}')
+
+
+class YieldScheduler(BaseModel):
+    """
+    Spends a fixed request budget on the providers bringing the most new publications.
+
+    Every provider is first asked for one page. From then on each request goes to the idle
+    provider with the best yield so far (`YieldTracker.score`), with at most `max_workers`
+    requests in flight and one per provider, since the next page of a provider may depend on
+    the previous one (cursors). As a provider starts returning what the others already gave,
+    its score drops and the rest of the budget shifts to the others: an idle provider scoring
+    below `min_share` of the best provider still paging waits for it rather than spend the
+    budget, unless nothing else is in flight.
+    """
+
+    budget: int = Field(ge=1)
+    # requests in flight after the first pages, by default half the providers
+    max_workers: int | None = Field(default=None, ge=1)
+    min_share: float = Field(default=0.25, ge=0, le=1)
+
+    def _pick(
+        self, idle: set[str], busy: set[str], tracker: YieldTracker, query_name: str
+    ) -> str | None:
+        def score(name: str) -> float:
+            return tracker.score(query_name, name)
+
+        best = max(idle, key=score)
+        if busy and score(best) < self.min_share * max(score(name) for name in busy):
+            return None
+        return best
+
+    @staticmethod
+    def _has_next(provider: Provider, page: ResultPage) -> bool:
+        if not page.items:
+            return False
+        if page.query.cursor is not None:
+            return page.next_cursor is not None
+        offset = page.start_index + page.items_per_page
+        return offset < page.total and (provider.max_depth is None or offset < provider.max_depth)
+
+    def run(
+        self,
+        jobs: dict[str, tuple[Provider, IQuery]],
+        tracker: YieldTracker,
+        query_name: str,
+        on_request: Callable[[], None] | None = None,
+        on_result: Callable[[str, bool], None] | None = None,
+    ) -> dict[str, ResultPage]:
+        """
+        Search the providers within the budget, returning their new publications by name.
+
+        `on_request` is called as each request completes and `on_result` with the provider
+        name and whether the request succeeded, e.g. to feed the provider circuit breakers.
+        """
+        budget = self.budget
+        workers = self.max_workers or max(1, (len(jobs) + 1) // 2)
+        results: dict[str, ResultPage] = {}
+        last: dict[str, ResultPage] = {}
+        idle: set[str] = set()
+
+        with ThreadPoolExecutor(
+            max_workers=max(workers, len(jobs)), thread_name_prefix='pysota-yield'
+        ) as pool:
+            futures: dict[Future[ResultPage], str] = {}
+            for provider_name, (provider, query) in list(jobs.items())[:budget]:
+                futures[pool.submit(provider.search, query)] = provider_name
+                budget -= 1
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider_name = futures.pop(future)
+                    provider = jobs[provider_name][0]
+                    if on_request is not None:
+                        on_request()
+                    error = future.exception()
+                    if error is not None:
+                        print(f'[red]Failed[/red]: [cyan]{provider_name}[/cyan]\n{error}')
+                        logger.opt(exception=error).error(
+                            f'Provider {provider_name} failed: {error}'
+                        )
+                        if on_result is not None:
+                            on_result(provider_name, False)
+                        continue
+                    page = future.result()
+                    if on_result is not None:
+                        on_result(provider_name, True)
+                    new = tracker.record(query_name, provider_name, page)
+                    if provider_name in results:
+                        results[provider_name].extend(page.model_copy(update={'items': new}))
+                    else:
+                        results[provider_name] = page.model_copy(update={'items': new})
+                    if self._has_next(provider, page):
+                        last[provider_name] = page
+                        idle.add(provider_name)
+
+                while budget > 0 and idle and len(futures) < workers:
+                    busy = set(futures.values())
+                    provider_name = self._pick(idle, busy, tracker, query_name)
+                    if provider_name is None:
+                        break
+                    idle.remove(provider_name)
+                    provider = jobs[provider_name][0]
+                    futures[pool.submit(provider.search_next, last[provider_name])] = provider_name
+                    budget -= 1
+                    logger.debug(f'{query_name}: next request to {provider_name}, {budget} left')
+
+        return results
@@ -1,12 +1,18 @@
 import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from datetime import date
 from functools import singledispatchmethod
+from typing import IO
 
-import requests
 from loguru import logger
 from pydantic import Field
-from rich import print, print_json
+from rich import print
 
-from pysota.core import IQuery, Provider, Publication, ResultPage
+from pysota.core import IQuery, Provider, Publication, RateLimit, ResultPage
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+ARXIV = '{http://arxiv.org/schemas/atom}'
 
 
 class ArxivQuery(IQuery):
@@ -23,6 +29,9 @@ class ArxivQuery(IQuery):
         include = [f'all:{term}' for term in self.include]
         include_str = '+OR+'.join(include)
         include_str = include_str.replace(' ', '_')
+        if self.dated:
+            # group the alternatives before AND-ing the date range
+            include_str = f'%28{include_str}%29'
         return f'search_query={include_str}'
 
     def _excludes(self) -> str:
@@ -39,6 +48,12 @@ class ArxivQuery(IQuery):
     def _start_index(self) -> str:
         return f'start={self.start_index}'
 
+    def _submitted(self) -> str:
+        if not self.dated:
+            return ''
+        since = f'{self.since:%Y%m%d}0000' if self.since else '000001010000'
+        return f'+AND+submittedDate:[{since}+TO+{self.until or date.today():%Y%m%d}2359]'
+
     def _sort_by(self) -> str:
         return 'sortBy=relevance&sortOrder=descending'
 
@@ -49,7 +64,7 @@ class ArxivQuery(IQuery):
         Returns:
             str: A URL to query the ArXiv API.
         """
-        url = self.base + self._includes() + self._excludes()
+        url = self.base + self._includes() + self._submitted() + self._excludes()
         url += f'&{self._max_results()}&{self._start_index()}&{self._sort_by()}'
         return url
 
@@ -65,7 +80,13 @@ class ArxivProvider(Provider):
     returned Atom XML response into Publication objects.
     """
 
+    query_type = ArxivQuery
+
     name: str = Field(default='arxiv', frozen=True)
+    # arXiv asks for a single connection and no more than one request every three seconds
+    rate_limit: RateLimit = Field(default=RateLimit(rate=1 / 3, burst=1, max_concurrent=1))
+    # the API does not return results past the first 30000 of a query
+    max_depth: int | None = Field(default=30000)
 
     @singledispatchmethod
     def search(self) -> ResultPage:
@@ -82,14 +103,7 @@ class ArxivProvider(Provider):
         all: bool = False,
     ) -> ResultPage:
         """Search ArXiv for papers matching the include and exclude lists."""
-        query = ArxivQuery(
-            name=name,
-            provider=self.name,
-            include=include,
-            exclude=exclude,
-            items_per_page=num_items,
-            start_index=offset,
-        )
+        query = self.make_query(name, include, exclude, num_items, offset)
         if all:
             return self.search_all(query)
         return self.search(query)
@@ -98,100 +112,103 @@ class ArxivProvider(Provider):
     def _(self, query: IQuery) -> ResultPage:
         url = query.generate_url()
         logger.info(f'Generated query: {url}')
-        response = requests.get(url)
-        data = response.text
-        root = ET.fromstring(data)
-        return self._build_results_page(root, query)
+        response = self.fetch(url, stream=True, query=query)
+        return self._build_results_page(response, query)
 
     def search_next(self, result_page: ResultPage) -> ResultPage:
         """
         Search the next page of results on ArXiv.
 
-        This method constructs a new URL for the next page of results based on the query and the
-        start index of the current result page. It then calls the search method with the new URL.   "
+        This method points the query of the current result page at the offset right after it
+        and calls the search method with the new query.
         """
-        next_query = ArxivQuery(
-            name=result_page.query.name,
-            provider=self.name,
-            include=result_page.query.include,
-            exclude=result_page.query.exclude,
-            items_per_page=result_page.query.items_per_page,
-            start_index=result_page.start_index + result_page.items_per_page - 1,
-        )
+        next_query = result_page.query.page_at(result_page.start_index + result_page.items_per_page)
         return self.search(next_query)
 
-    def search_all(self, query: IQuery) -> ResultPage:
-        self.log('Searching all results')
-        first = self.search(query)
-        print_json(first.model_dump_json())
-        index = first.start_index + 1
-        results = first
-        print(f'{index=} < {first.total=} = {index < first.total}')
-        while index < first.total:
-            print(f'Fetching next page of results starting at index {index}')
-            new = self.search_next(results)
-            results.extend(new)
-            index += new.num_items
-        print(f'Downloaded [green]{results.num_items}[/green] results')
-        return results
-
-    # fmt: on
     def extract_items(self, payload, query: IQuery) -> list[Publication]:
         """
         Parse the Atom XML payload from ArXiv and extract Publication objects.
 
         Args:
-            payload: An ElementTree object representing the XML response.
+            payload: A readable byte stream with the XML response.
 
         Returns:
             list[Publication]: A list of Publication objects with title, authors, year, and abstract.
         """
-        papers = []
-        # Iterate over each <entry> element which represents a paper
+        return list(self.iter_items(payload, query, {}))
+
+    def iter_items(
+        self, source: IO[bytes], query: IQuery, feed: dict[str, str | None]
+    ) -> Iterator[Publication]:
+        """
+        Incrementally parse an Atom XML stream, yielding a Publication as each <entry> closes.
+
+        Finished entries are cleared from the tree as soon as they are converted, so memory use
+        does not grow with the page size. The OpenSearch pagination tags found along the way
+        are stored in `feed`, keyed by their local name (totalResults, startIndex, ...).
+
+        Args:
+            source: A readable byte stream with the XML response.
+            query: The query that produced the response.
+            feed: Dictionary filled with the OpenSearch tags of the feed.
+        """
         idx = query.start_index
-        for entry in payload.findall('{http://www.w3.org/2005/Atom}entry'):
-            title = entry.find('{http://www.w3.org/2005/Atom}title').text
-            # Extract authors from each <author> element
-            authors = [
-                author.find('{http://www.w3.org/2005/Atom}name').text
-                for author in entry.findall('{http://www.w3.org/2005/Atom}author')
-            ]
-            # Get the publication year from the <published> element (first 4 characters)
-            year = entry.find('{http://www.w3.org/2005/Atom}published').text[:4]
-            summary = entry.find('{http://www.w3.org/2005/Atom}summary').text
-
-            pub = Publication(
-                title=title,
-                authors=authors,
-                year=year,
-                abstract=summary,
-                internal_index=idx,
-                provider_name=self.name,
-                query_name=query.name,
-            )
-            papers.append(pub)
-            idx += 1
-        return papers
-
-    def _build_results_page(self, root: ET.Element, query: IQuery) -> ResultPage:
+        context = ET.iterparse(source, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event != 'end':
+                continue
+            if elem.tag.startswith(OPENSEARCH):
+                feed[elem.tag.removeprefix(OPENSEARCH)] = elem.text
+            elif elem.tag == f'{ATOM}entry':
+                yield self._build_publication(elem, idx, query)
+                idx += 1
+                # drop the finished entry (and anything before it) from the tree
+                root.clear()
+
+    def _build_publication(self, entry: ET.Element, idx: int, query: IQuery) -> Publication:
+        title = entry.find(f'{ATOM}title').text  # type: ignore
+        # Extract authors from each <author> element
+        authors = [
+            author.find(f'{ATOM}name').text  # type: ignore
+            for author in entry.findall(f'{ATOM}author')
+        ]
+        # Get the publication date and year from the <published> element
+        published = entry.find(f'{ATOM}published').text[:10]  # type: ignore
+        year = published[:4]
+        summary = entry.find(f'{ATOM}summary').text  # type: ignore
+        doi = entry.findtext(f'{ARXIV}doi') or ''
+
+        return Publication(
+            title=title,
+            authors=authors,
+            year=year,
+            abstract=summary,
+            published=published,
+            doi=doi,
+            internal_index=idx,
+            provider_name=self.name,
+            query_name=query.name,
+        )
+
+    def _build_results_page(self, response, query: IQuery) -> ResultPage:
         """
-        Build a ResultPage object from the XML root element.
+        Build a ResultPage object streaming through the Atom XML response.
 
-        Args: root (ET.Element): The root element of the XML response.
+        Args: response (requests.Response): The response of the ArXiv API.
 
         Returns:
             ResultPage: A ResultPage object with Publication items.
         """
-        # Extract pagination information using OpenSearch tags
-        total = root.find('{http://a9.com/-/spec/opensearch/1.1/}totalResults').text  # type: ignore
-        start_index = root.find('{http://a9.com/-/spec/opensearch/1.1/}startIndex').text  # type: ignore
-        items_per_page = root.find('{http://a9.com/-/spec/opensearch/1.1/}itemsPerPage').text  # type: ignore
-        papers = self.extract_items(root, query)
+        feed: dict[str, str | None] = {}
+        with response:
+            papers = list(self.iter_items(self.body_stream(response), query, feed))
 
-        # Convert pagination strings to integers (defaulting to -1 if conversion fails)
-        total = int(total) if total is not None else -1
-        items_per_page = int(items_per_page) if items_per_page is not None else -1
-        start_index = int(start_index) if start_index is not None else -1
+        # Extract pagination information from the OpenSearch tags
+        # (defaulting to -1 if they are missing)
+        total = int(feed.get('totalResults') or -1)
+        items_per_page = int(feed.get('itemsPerPage') or -1)
+        start_index = int(feed.get('startIndex') or -1)
 
         print(f'Found {total} matches')
         results = ResultPage(
@@ -200,5 +217,6 @@ class ArxivProvider(Provider):
             items_per_page=items_per_page,
             start_index=start_index,
             items=papers,
+            cache_hits=int(getattr(response, 'from_cache', False)),
         )
         return results
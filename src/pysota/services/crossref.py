@@ -1,11 +1,11 @@
 from functools import singledispatchmethod
+from urllib.parse import quote
 
-import requests
 from loguru import logger
 from pydantic import Field
 from rich import print, print_json
 
-from pysota.core import IQuery, Provider, ResultPage
+from pysota.core import IQuery, Provider, RateLimit, ResultPage
 from pysota.core.publication import Publication
 
 
@@ -30,9 +30,16 @@ class CrossrefQuery(IQuery):
             )
         url = self.base + self._includes()
         url += '&filter=has-abstract:1'
-        url += '&select=title,author,abstract,published'
+        if self.since is not None:
+            url += f',from-pub-date:{self.since.isoformat()}'
+        if self.until is not None:
+            url += f',until-pub-date:{self.until.isoformat()}'
+        url += '&select=DOI,title,author,abstract,published'
         url += f'&rows={self.items_per_page}'
-        if self.start_index > 0:
+        if self.cursor is not None:
+            # deep paging: the cursor replaces the offset
+            url += f'&cursor={quote(self.cursor, safe="*")}'
+        elif self.start_index > 0:
             url += f'&offset={self.start_index}'
         return url
 
@@ -45,8 +52,16 @@ class CrossrefProvider(Provider):
     This provider sends a query to the Crossref API and converts the response into Publication objects.
     """
 
+    query_type = CrossrefQuery
+    start_cursor = '*'
+
     name: str = Field(default='crossref', frozen=True)
+    # public pool; Crossref announces the live limit in the X-Rate-Limit-* headers
+    rate_limit: RateLimit = Field(default=RateLimit(rate=5.0, burst=5, max_concurrent=3))
     query_root: str = Field(default='https://api.crossref.org/works', frozen=True)
+    # offsets are capped at 10000, cursors reach the whole result set
+    max_depth: int | None = Field(default=10000)
+    cursor_paging: bool = Field(default=True)
 
     @singledispatchmethod
     def search(self) -> ResultPage:
@@ -62,22 +77,16 @@ class CrossrefProvider(Provider):
         offset: int = 0,
         all: bool = False,
     ) -> ResultPage:
-        query = CrossrefQuery(
-            name=name,
-            provider=self.name,
-            include=include,
-            exclude=exclude,
-            items_per_page=num_items,
-            start_index=offset,
-        )
-
+        query = self.make_query(name, include, exclude, num_items, offset)
+        if all:
+            return self.search_all(query)
         return self.search(query)
 
     @search.register
     def _(self, query: CrossrefQuery) -> ResultPage:
         url = query.generate_url()
         logger.info(f'Generated query: {url}')
-        response = requests.get(url)
+        response = self.fetch(url, query=query)
         return self._build_results_page(response, query)
 
     def extract_items(self, payload, query: IQuery) -> list[Publication]:
@@ -94,13 +103,17 @@ class CrossrefProvider(Provider):
 
                 title = entry.get('title', [])[0] if entry.get('title') else 'No Title'
                 abstract = entry.get('abstract', '')
-                year = entry.get('published', {}).get('date-parts', [[None]])[0][0] or -1
+                date_parts = entry.get('published', {}).get('date-parts', [[None]])[0]
+                year = date_parts[0] or -1
+                published = '-'.join(f'{p:02d}' for p in date_parts if p) if year > 0 else ''
 
                 pub = Publication(
                     title=title,
                     authors=authors,
                     year=year,
                     abstract=abstract,
+                    published=published,
+                    doi=entry.get('DOI', ''),
                     internal_index=idx,
                     provider_name=self.name,
                     query_name=query.name,
@@ -114,18 +127,14 @@ class CrossrefProvider(Provider):
         return papers
 
     def search_next(self, result_page) -> ResultPage:
-        next_query = CrossrefQuery(
-            name=result_page.query.name,
-            provider=self.name,
-            include=result_page.query.include,
-            exclude=result_page.query.exclude,
-            items_per_page=result_page.query.items_per_page,
-            start_index=result_page.start_index + result_page.items_per_page - 1,
+        next_query = result_page.query.page_at(
+            result_page.start_index + result_page.items_per_page, result_page.next_cursor
         )
         return self.search(next_query)
 
     def _build_results_page(self, response, query: CrossrefQuery) -> ResultPage:
-        total = response.json()['message']['total-results']
+        message = response.json()['message']
+        total = message['total-results']
         papers = self.extract_items(response, query)
         print(f'Found {total} matches')
         res = ResultPage(
@@ -134,5 +143,7 @@ class CrossrefProvider(Provider):
             items_per_page=query.items_per_page,
             start_index=query.start_index,
             items=papers,
+            cache_hits=int(getattr(response, 'from_cache', False)),
+            next_cursor=message.get('next-cursor') if query.cursor is not None else None,
         )
         return res
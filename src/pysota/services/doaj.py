@@ -1,6 +1,38 @@
+from functools import singledispatchmethod
+from urllib.parse import quote
+
+from loguru import logger
 from pydantic import Field
-import requests
-from pysota.core import Provider, ResultPage, Publication
+from rich import print
+
+from pysota.core import IQuery, Provider, Publication, RateLimit, ResultPage
+
+
+class DOAJQuery(IQuery):
+    """
+    Query object for the DOAJ article search.
+
+    The query is an Elasticsearch query string sent in the URL path: the include terms are
+    OR-ed and the exclude terms NOT-ed. DOAJ has no publication date to filter on, so the date
+    range, if any, applies to the date the article was added to DOAJ (`created_date`), which
+    is what delta harvests need. Pages are numbered from 1.
+    """
+
+    base: str = Field(default='https://doaj.org/api/search/articles/', frozen=True)
+
+    def _query(self) -> str:
+        text = ' OR '.join(f'"{term}"' for term in self.include)
+        if len(self.exclude) > 0:
+            text = f'({text}) NOT (' + ' OR '.join(f'"{term}"' for term in self.exclude) + ')'
+        if self.dated:
+            since = self.since.isoformat() if self.since else '*'
+            until = self.until.isoformat() if self.until else '*'
+            text = f'({text}) AND created_date:[{since} TO {until}]'
+        return quote(text, safe='')
+
+    def generate_url(self) -> str:
+        page = self.start_index // self.items_per_page + 1 if self.items_per_page > 0 else 1
+        return f'{self.base}{self._query()}?page={page}&pageSize={self.items_per_page}'
 
 
 class DOAJProvider(Provider):
@@ -12,24 +44,45 @@ class DOAJProvider(Provider):
 
     Note:
         - The API is free and does not require an API key.
+        - It has neither cursors nor field selection: whole result sets are paged 100 articles
+          (the largest page) at a time, up to the first 1000; broader searches should be
+          sharded by date.
     """
 
+    query_type = DOAJQuery
+    harvest_page_size = 100
+
     name: str = Field(default='DOAJ', frozen=True)
-    query_root: str = Field(default='https://doaj.org/api/v2/articles/', frozen=True)
+    rate_limit: RateLimit = Field(default=RateLimit(rate=2.0, burst=5, max_concurrent=2))
+    max_depth: int | None = Field(default=1000)
 
-    def generate_query(self, query: str) -> str:
-        """
-        Return the query string as-is.
+    @singledispatchmethod
+    def search(self) -> ResultPage:
+        raise NotImplementedError
 
-        Args:
-            query (str): The search query.
+    @search.register
+    def _(
+        self,
+        name: str,
+        include: list,
+        exclude: list | None = None,
+        num_items: int = 10,
+        offset: int = 0,
+        all: bool = False,
+    ) -> ResultPage:
+        query = self.make_query(name, include, exclude or [], num_items, offset)
+        if all:
+            return self.search_all(query)
+        return self.search(query)
 
-        Returns:
-            str: The same query string.
-        """
-        return query
+    @search.register
+    def _(self, query: DOAJQuery) -> ResultPage:
+        url = query.generate_url()
+        logger.info(f'Generated query: {url}')
+        response = self.fetch(url, query=query)
+        return self._build_results_page(response, query)
 
-    def extract_items(self, payload) -> list[Publication]:
+    def extract_items(self, payload, query: IQuery) -> list[Publication]:
         """
         Extract Publication objects from the JSON payload returned by DOAJ.
 
@@ -40,42 +93,49 @@ class DOAJProvider(Provider):
             list[Publication]: A list of Publication objects.
         """
         publications = []
+        idx = query.start_index
         # DOAJ returns a "results" list containing article metadata.
-        results = payload.get('results', [])
-        for item in results:
-            bibjson = item.get('bibjson', {})
-            title = bibjson.get('title', 'No Title')
-            authors_data = bibjson.get('author', [])
-            authors = [author.get('name', '') for author in authors_data]
-            year = bibjson.get('year', 'Unknown')
-            abstract = bibjson.get('abstract', '')
-            publications.append(
-                Publication(title=title, authors=authors, year=year, abstract=abstract)
-            )
+        for item in payload.get('results', []):
+            try:
+                bibjson = item.get('bibjson', {})
+                year = str(bibjson.get('year') or '')
+                month = str(bibjson.get('month') or '')
+                published = f'{year}-{int(month):02d}' if year and month.isdigit() else year
+                identifiers = bibjson.get('identifier', [])
+                doi = next((i.get('id', '') for i in identifiers if i.get('type') == 'doi'), '')
+                publications.append(
+                    Publication(
+                        title=bibjson.get('title') or 'No Title',
+                        authors=[author.get('name', '') for author in bibjson.get('author', [])],
+                        year=int(year) if year.isdigit() else -1,
+                        abstract=bibjson.get('abstract') or '',
+                        published=published,
+                        doi=doi,
+                        internal_index=idx,
+                        provider_name=self.name,
+                        query_name=query.name,
+                    )
+                )
+                idx += 1
+            except (AttributeError, TypeError, ValueError) as e:
+                print(f'[red]Caught![/red] {item.get("id")}: {e}')
+                logger.warning(f'Skipping {item.get("id")}: {e}')
         return publications
 
-    def search(self, query: str) -> ResultPage:
-        """
-        Search DOAJ for articles matching the query and return a ResultPage.
-
-        Args:
-            query (str): The search query.
+    def search_next(self, result_page: ResultPage) -> ResultPage:
+        next_query = result_page.query.page_at(result_page.start_index + result_page.items_per_page)
+        return self.search(next_query)
 
-        Returns:
-            ResultPage: A page of results with Publication items.
-        """
-        self.log(f'Querying DOAJ: {query}')
-        params = {'q': query, 'page': 1, 'pageSize': 10}
-        response = requests.get(self.query_root, params=params)
-        response.raise_for_status()
+    def _build_results_page(self, response, query: DOAJQuery) -> ResultPage:
         data = response.json()
-        items = self.extract_items(data)
+        items = self.extract_items(data, query)
         total = data.get('total', len(items))
         self.log(f'Found {total} results')
         return ResultPage(
             query=query,
             total=total,
-            items_per_page=len(items),
-            start_index=0,
+            items_per_page=query.items_per_page,
+            start_index=query.start_index,
             items=items,
+            cache_hits=int(getattr(response, 'from_cache', False)),
         )
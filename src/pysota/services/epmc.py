@@ -1,7 +1,41 @@
-import requests
+from functools import singledispatchmethod
+from urllib.parse import quote, quote_plus
+
+from loguru import logger
 from pydantic import Field
+from rich import print
+
+from pysota.core import IQuery, Provider, Publication, RateLimit, ResultPage
+
+
+class EuropePMCQuery(IQuery):
+    """
+    Query object for the Europe PMC REST search.
+
+    The include terms are OR-ed and the exclude terms NOT-ed; the date range, if any, filters
+    on the first publication date. Europe PMC only pages by `cursorMark`, so a query without a
+    cursor asks for the first page. `resultType=core` is needed for the abstracts.
+    """
+
+    base: str = Field(
+        default='https://www.ebi.ac.uk/europepmc/webservices/rest/search?', frozen=True
+    )
 
-from pysota.core import Provider, Publication, ResultPage
+    def _query(self) -> str:
+        text = ' OR '.join(f'"{term}"' for term in self.include)
+        if len(self.exclude) > 0:
+            text = f'({text}) NOT (' + ' OR '.join(f'"{term}"' for term in self.exclude) + ')'
+        if self.dated:
+            since = self.since.isoformat() if self.since else '1000-01-01'
+            until = self.until.isoformat() if self.until else '3000-12-31'
+            text = f'({text}) AND FIRST_PDATE:[{since} TO {until}]'
+        return f'query={quote_plus(text)}'
+
+    def generate_url(self) -> str:
+        url = self.base + self._query()
+        url += f'&format=json&resultType=core&pageSize={self.items_per_page}'
+        url += f'&cursorMark={quote(self.cursor or "*", safe="*")}'
+        return url
 
 
 class EuropePMCProvider(Provider):
@@ -10,29 +44,56 @@ class EuropePMCProvider(Provider):
 
     Europe PMC provides free access to a large database of biomedical and life sciences literature.
     This provider sends a search query and parses the JSON response into Publication objects.
+    Whole result sets are paged by `cursorMark`, 1000 records (the largest page) at a time.
 
     Note:
         - The API is free but may have rate limits.
+        - Offsets are not supported: searches start from the first result.
     """
 
+    query_type = EuropePMCQuery
+    start_cursor = '*'
+    harvest_page_size = 1000
+
     name: str = Field(default='EuropePMC', frozen=True)
-    query_root: str = Field(
-        default='https://www.ebi.ac.uk/europepmc/webservices/rest/search', frozen=True
-    )
+    rate_limit: RateLimit = Field(default=RateLimit(rate=10.0, burst=10, max_concurrent=4))
 
-    def generate_query(self, query: str) -> str:
-        """
-        Return the query string as-is.
+    def make_query(
+        self, name: str, include: list, exclude: list, num_items: int, offset: int
+    ) -> IQuery:
+        # Europe PMC only pages by cursor, every search starts at the first one
+        if offset > 0:
+            print('[yellow]Warning:[/yellow] Europe PMC does not support offsets, ignoring it')
+        query = super().make_query(name, include, exclude, num_items, 0)
+        return query.page_at(0, self.start_cursor)
 
-        Args:
-            query (str): The search query.
+    @singledispatchmethod
+    def search(self) -> ResultPage:
+        raise NotImplementedError
 
-        Returns:
-            str: The same query string.
-        """
-        return query
+    @search.register
+    def _(
+        self,
+        name: str,
+        include: list,
+        exclude: list | None = None,
+        num_items: int = 10,
+        offset: int = 0,
+        all: bool = False,
+    ) -> ResultPage:
+        query = self.make_query(name, include, exclude or [], num_items, offset)
+        if all:
+            return self.search_all(query)
+        return self.search(query)
+
+    @search.register
+    def _(self, query: EuropePMCQuery) -> ResultPage:
+        url = query.generate_url()
+        logger.info(f'Generated query: {url}')
+        response = self.fetch(url, query=query)
+        return self._build_results_page(response, query)
 
-    def extract_items(self, payload) -> list[Publication]:
+    def extract_items(self, payload, query: IQuery) -> list[Publication]:
         """
         Extract Publication objects from the JSON payload returned by Europe PMC.
 
@@ -43,46 +104,52 @@ class EuropePMCProvider(Provider):
             list[Publication]: A list of Publication objects.
         """
         publications = []
+        idx = query.start_index
         # Europe PMC returns a "resultList" containing a "result" array.
-        results = payload.get('resultList', {}).get('result', [])
-        for item in results:
-            title = item.get('title', 'No Title')
-            # Extract authors from the author string (if available)
-            authors_string = item.get('authorString', '')
-            authors = [a.strip() for a in authors_string.split(',')] if authors_string else []
-            year = item.get('pubYear', 'Unknown')
-            abstract = item.get('abstractText', '')
-            publications.append(
-                Publication(title=title, authors=authors, year=year, abstract=abstract)
-            )
+        for item in payload.get('resultList', {}).get('result', []):
+            try:
+                # Extract authors from the author string (if available)
+                authors_string = item.get('authorString', '')
+                authors = [a.strip() for a in authors_string.split(',')] if authors_string else []
+                year = str(item.get('pubYear') or '')
+                publications.append(
+                    Publication(
+                        title=item.get('title') or 'No Title',
+                        authors=authors,
+                        year=int(year) if year.isdigit() else -1,
+                        abstract=item.get('abstractText') or '',
+                        published=item.get('firstPublicationDate') or year,
+                        doi=item.get('doi') or '',
+                        internal_index=idx,
+                        provider_name=self.name,
+                        query_name=query.name,
+                    )
+                )
+                idx += 1
+            except (AttributeError, TypeError, ValueError) as e:
+                print(f'[red]Caught![/red] {item.get("id")}: {e}')
+                logger.warning(f'Skipping {item.get("id")}: {e}')
         return publications
 
-    def search(self, query: str) -> ResultPage:
-        """
-        Search Europe PMC for articles matching the query and return a ResultPage.
-
-        Args:
-            query (str): The search query.
+    def search_next(self, result_page: ResultPage) -> ResultPage:
+        next_query = result_page.query.page_at(
+            result_page.start_index + result_page.items_per_page, result_page.next_cursor
+        )
+        return self.search(next_query)
 
-        Returns:
-            ResultPage: A page of results with Publication items.
-        """
-        self.log(f'Query: {query}')
-        params = {
-            'query': query,
-            'format': 'json',
-            'pageSize': 10,  # Limit results for this example
-        }
-        response = requests.get(self.query_root, params=params)
-        response.raise_for_status()
+    def _build_results_page(self, response, query: EuropePMCQuery) -> ResultPage:
         data = response.json()
-        items = self.extract_items(data)
+        items = self.extract_items(data, query)
         total = int(data.get('hitCount', len(items)))
         self.log(f'Found {total} results')
+        # the last page hands back the cursor it was requested with
+        next_cursor = data.get('nextCursorMark')
         return ResultPage(
             query=query,
             total=total,
-            items_per_page=len(items),
-            start_index=0,
+            items_per_page=query.items_per_page,
+            start_index=query.start_index,
             items=items,
+            cache_hits=int(getattr(response, 'from_cache', False)),
+            next_cursor=next_cursor if next_cursor != (query.cursor or '*') else None,
         )
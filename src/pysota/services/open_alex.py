@@ -1,6 +1,53 @@
-import requests
-from pysota.core import Provider, ResultPage, Publication
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, singledispatchmethod
+from urllib.parse import quote, quote_plus
+
+from loguru import logger
 from pydantic import Field
+from rich import print
+
+from pysota.core import IQuery, Provider, Publication, RateLimit, ResultPage
+
+
+# fields requested from the API, everything else is left out of the payload
+SELECT = 'id,doi,display_name,authorships,publication_year,publication_date,abstract_inverted_index'
+DOI_URL = 'https://doi.org/'
+
+
+class OpenAlexQuery(IQuery):
+    """
+    Query object for the OpenAlex works API.
+
+    The include terms are OR-ed and the exclude terms NOT-ed in a full text `search`; the date
+    range, if any, filters on the publication date. Only the fields the provider reads are
+    selected. Queries carrying a cursor page by cursor, the others by page number.
+    """
+
+    base: str = Field(default='https://api.openalex.org/works?', frozen=True)
+
+    def _search(self) -> str:
+        text = ' OR '.join(f'"{term}"' for term in self.include)
+        if len(self.exclude) > 0:
+            text = f'({text}) NOT (' + ' OR '.join(f'"{term}"' for term in self.exclude) + ')'
+        return f'search={quote_plus(text)}'
+
+    def _filter(self) -> str:
+        filters = []
+        if self.since is not None:
+            filters.append(f'from_publication_date:{self.since.isoformat()}')
+        if self.until is not None:
+            filters.append(f'to_publication_date:{self.until.isoformat()}')
+        return f'&filter={",".join(filters)}' if filters else ''
+
+    def generate_url(self) -> str:
+        url = self.base + self._search() + self._filter()
+        url += f'&select={SELECT}&per_page={self.items_per_page}'
+        if self.cursor is not None:
+            url += f'&cursor={quote(self.cursor, safe="*")}'
+        elif self.start_index > 0 and self.items_per_page > 0:
+            url += f'&page={self.start_index // self.items_per_page + 1}'
+        return url
 
 
 class OpenAlexProvider(Provider):
@@ -8,25 +55,110 @@ class OpenAlexProvider(Provider):
     Provider for querying the OpenAlex API.
 
     OpenAlex is a free, open catalog of scholarly works. This provider sends a search query
-    to OpenAlex and converts the JSON response into a list of Publication objects.
+    to OpenAlex and converts the JSON response into a list of Publication objects. Whole result
+    sets are paged by cursor, 200 works (the largest page) at a time.
+
+    Abstracts are looked up in bulk, by DOI with `lookup_batch` DOIs OR-ed in a single filter,
+    and by title with `title_batch` title searches OR-ed the same way.
     """
 
+    query_type = OpenAlexQuery
+    start_cursor = '*'
+    harvest_page_size = 200
+    bulk_lookup = True
+
     name: str = Field(default='OpenAlex', frozen=True)
-    query_root: str = Field(default='https://api.openalex.org/works', frozen=True)
+    rate_limit: RateLimit = Field(default=RateLimit(rate=10.0, burst=10, max_concurrent=5))
+    # page numbers reach the first 10000 works, cursors the whole result set
+    max_depth: int | None = Field(default=10000)
+    cursor_paging: bool = Field(default=True)
+    lookup_root: str = Field(default='https://api.openalex.org/works', frozen=True)
+    # DOIs per lookup request, a filter takes up to 100 alternatives
+    lookup_batch: int = Field(default=50, ge=1, le=100)
+    # titles per lookup request, kept lower as every title is a full text search
+    title_batch: int = Field(default=10, ge=1, le=40)
 
-    def generate_query(self, query: str) -> str:
-        """
-        Return the query string directly.
+    @singledispatchmethod
+    def search(self) -> ResultPage:
+        raise NotImplementedError
 
-        Args:
-            query (str): The search query.
+    @search.register
+    def _(
+        self,
+        name: str,
+        include: list,
+        exclude: list | None = None,
+        num_items: int = 10,
+        offset: int = 0,
+        all: bool = False,
+    ) -> ResultPage:
+        query = self.make_query(name, include, exclude or [], num_items, offset)
+        if all:
+            return self.search_all(query)
+        return self.search(query)
 
-        Returns:
-            str: The same query string.
-        """
-        return query
+    @search.register
+    def _(self, query: OpenAlexQuery) -> ResultPage:
+        url = query.generate_url()
+        logger.info(f'Generated query: {url}')
+        response = self.fetch(url, query=query)
+        return self._build_results_page(response, query)
+
+    @staticmethod
+    def abstract(inverted_index: dict[str, list[int]] | None) -> str:
+        """Rebuild an abstract from the inverted index (word -> positions) OpenAlex serves."""
+        if not inverted_index:
+            return ''
+        words = {pos: word for word, positions in inverted_index.items() for pos in positions}
+        return ' '.join(words[pos] for pos in sorted(words))
+
+    def lookup_abstracts(self, dois: list[str], titles: list[str]) -> dict[str, str]:
+        def by_doi(batch: list[str]) -> dict[str, str]:
+            alternatives = '|'.join(quote(doi, safe='/') for doi in batch)
+            url = f'{self.lookup_root}?filter=doi:{alternatives}'
+            url += f'&select=doi,abstract_inverted_index&per_page={len(batch)}'
+            return {
+                (work.get('doi') or '').removeprefix(DOI_URL).lower(): abstract
+                for work in self.fetch(url).json().get('results', [])
+                if (abstract := self.abstract(work.get('abstract_inverted_index')))
+            }
+
+        def words(title: str) -> str:
+            # filter values are comma separated, punctuation is left out of the search
+            return re.sub(r'\W+', ' ', title).strip().lower()
+
+        def by_title(batch: list[str]) -> dict[str, str]:
+            wanted = {words(title): title for title in batch}
+            alternatives = '|'.join(quote_plus(key) for key in wanted)
+            url = f'{self.lookup_root}?filter=title.search:{alternatives}'
+            # a few candidates per title, the exact title matches are kept
+            url += f'&select=display_name,abstract_inverted_index&per_page={5 * len(batch)}'
+            found = {}
+            for work in self.fetch(url).json().get('results', []):
+                title = wanted.get(words(work.get('display_name') or ''))
+                abstract = self.abstract(work.get('abstract_inverted_index'))
+                if title is not None and abstract and title not in found:
+                    found[title] = abstract
+            return found
 
-    def extract_items(self, payload) -> list[Publication]:
+        jobs = [
+            partial(by_doi, dois[i : i + self.lookup_batch])
+            for i in range(0, len(dois), self.lookup_batch)
+        ]
+        titles = [title for title in titles if words(title)]
+        jobs += [
+            partial(by_title, titles[i : i + self.title_batch])
+            for i in range(0, len(titles), self.title_batch)
+        ]
+        found: dict[str, str] = {}
+        with ThreadPoolExecutor(
+            max_workers=self.rate_limit.max_concurrent, thread_name_prefix='pysota-openalex'
+        ) as pool:
+            for result in pool.map(lambda job: job(), jobs):
+                found.update(result)
+        return found
+
+    def extract_items(self, payload, query: IQuery) -> list[Publication]:
         """
         Extract Publication objects from the JSON payload returned by OpenAlex.
 
@@ -37,42 +169,47 @@ class OpenAlexProvider(Provider):
             list[Publication]: A list of Publication objects.
         """
         publications = []
+        idx = query.start_index
         for work in payload.get('results', []):
-            title = work.get('display_name', 'No Title')
-            authorships = work.get('authorships', [])
-            authors = [auth.get('author', {}).get('display_name', '') for auth in authorships]
-            year = work.get('publication_year', 'Unknown')
-            abstract = work.get('abstract', '')
-            publications.append(
-                Publication(title=title, authors=authors, year=year, abstract=abstract)
-            )
+            try:
+                authorships = work.get('authorships') or []
+                publications.append(
+                    Publication(
+                        title=work.get('display_name') or 'No Title',
+                        authors=[a.get('author', {}).get('display_name', '') for a in authorships],
+                        year=work.get('publication_year') or -1,
+                        abstract=self.abstract(work.get('abstract_inverted_index')),
+                        published=work.get('publication_date') or '',
+                        doi=(work.get('doi') or '').removeprefix(DOI_URL),
+                        internal_index=idx,
+                        provider_name=self.name,
+                        query_name=query.name,
+                    )
+                )
+                idx += 1
+            except (AttributeError, TypeError, ValueError) as e:
+                print(f'[red]Caught![/red] {work.get("id")}: {e}')
+                logger.warning(f'Skipping {work.get("id")}: {e}')
         return publications
 
-    def search(self, query: str) -> ResultPage:
-        """
-        Perform a search using the OpenAlex API and return a ResultPage.
-
-        Args:
-            query (str): The search query.
+    def search_next(self, result_page: ResultPage) -> ResultPage:
+        next_query = result_page.query.page_at(
+            result_page.start_index + result_page.items_per_page, result_page.next_cursor
+        )
+        return self.search(next_query)
 
-        Returns:
-            ResultPage: A page of results with Publication items.
-        """
-        self.log(f'Querying OpenAlex: {query}')
-        params = {
-            'search': query,
-            'per_page': 10,  # Number of results per page
-        }
-        response = requests.get(self.query_root, params=params)
-        response.raise_for_status()
+    def _build_results_page(self, response, query: OpenAlexQuery) -> ResultPage:
         data = response.json()
-        items = self.extract_items(data)
-        total = data.get('meta', {}).get('count', len(items))
+        meta = data.get('meta', {})
+        items = self.extract_items(data, query)
+        total = meta.get('count', len(items))
         self.log(f'Found {total} results')
         return ResultPage(
             query=query,
             total=total,
-            items_per_page=len(items),
-            start_index=0,
+            items_per_page=query.items_per_page,
+            start_index=query.start_index,
             items=items,
+            cache_hits=int(getattr(response, 'from_cache', False)),
+            next_cursor=meta.get('next_cursor') if query.cursor is not None else None,
         )
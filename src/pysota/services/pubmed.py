@@ -1,123 +1,339 @@
-import urllib.parse
+import calendar
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from functools import singledispatchmethod
+from typing import IO, NamedTuple
+from urllib.parse import urlencode
 
 import requests
-from pydantic import Field
+from loguru import logger
+from pydantic import Field, PrivateAttr
+from rich import print
 
-from pysota.core import Provider, Publication, ResultPage
+from pysota.core import HarvestCheckpoint, IQuery, Provider, Publication, RateLimit, ResultPage
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_abbr) if name}
+
+
+class History(NamedTuple):
+    """Search results stored on the E-utilities history server."""
+
+    webenv: str
+    query_key: str
+    count: int
+    # `time.monotonic()` of the ESearch that stored it
+    created: float
+
+
+class HistoryExpiredError(RuntimeError):
+    """Raised when EFetch no longer finds a search on the history server."""
+
+
+class PubMedQuery(IQuery):
+    """
+    Query object for PubMed.
+
+    The query is a PubMed search term: the include terms are OR-ed, the exclude terms are
+    NOT-ed and the date range, if any, is matched against the publication date ([dp]).
+    `generate_url` describes the query as the ESearch request that resolves it; the provider
+    stores that search on the history server and pages through it with EFetch.
+    """
+
+    base: str = Field(default='https://eutils.ncbi.nlm.nih.gov/entrez/eutils/', frozen=True)
+
+    def term(self) -> str:
+        term = ' OR '.join(f'({t})' for t in self.include)
+        if len(self.include) > 1:
+            term = f'({term})'
+        if self.dated:
+            since = f'{self.since:%Y/%m/%d}' if self.since else '1000'
+            until = f'{self.until:%Y/%m/%d}' if self.until else '3000'
+            term += f' AND ("{since}"[dp] : "{until}"[dp])'
+        if len(self.exclude) > 0:
+            term += ' NOT (' + ' OR '.join(f'({t})' for t in self.exclude) + ')'
+        return term
+
+    def generate_url(self) -> str:
+        params = {
+            'db': 'pubmed',
+            'term': self.term(),
+            'retstart': self.start_index,
+            'retmax': self.items_per_page,
+            'usehistory': 'y',
+        }
+        return f'{self.base}esearch.fcgi?{urlencode(params)}'
 
 
 class PubMedProvider(Provider):
     """
     Provider for querying PubMed using NCBI's free E-utilities API.
 
-    This provider performs a two-step search:
-      1. It calls the ESearch endpoint to get a list of PubMed IDs matching the query.
-      2. It calls the ESummary endpoint to retrieve detailed metadata (e.g., title, authors, publication date)
-         for the retrieved IDs.
+    Searches are two-step:
+      1. ESearch runs the query once with `usehistory=y`, leaving the matching PubMed IDs on
+         the history server (WebEnv + query_key) and reporting how many there are.
+      2. EFetch downloads the full records of one page (`retstart`/`retmax`) of that stored
+         result set as PubMed XML, which includes the abstracts.
+
+    Harvests (`iter_pages`) fetch at least `batch_size` records per EFetch request and keep
+    several of them in flight within the NCBI rate limit. The XML is parsed incrementally,
+    one <PubmedArticle> at a time.
 
     Note:
       - The PubMed API is free but subject to rate limits and usage guidelines.
-      - The abstract is typically not provided by ESummary, so it is left empty.
+      - ESearch does not reach past the first 10000 records of a search; broader searches
+        should be sharded by date.
+      - The history server drops a search after a few hours: it is run again past
+        `history_ttl`, or as soon as EFetch reports it gone. EFetch pages are cached by search
+        term and range, not by the session in their URL, so they are reused across runs.
     """
 
+    query_type = PubMedQuery
+
     name: str = Field(default='PubMed', frozen=True)
-    # Base URLs for the ESearch and ESummary endpoints.
-    query_root: str = Field(
-        default='https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi', frozen=True
-    )
-    summary_root: str = Field(
-        default='https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi', frozen=True
+    # NCBI allows 3 requests per second without an API key
+    rate_limit: RateLimit = Field(default=RateLimit(rate=3.0, burst=3, max_concurrent=3))
+    max_depth: int | None = Field(default=10000)
+    # records requested per EFetch call when harvesting every page
+    batch_size: int = Field(default=500, ge=1, le=10000)
+    # EFetch endpoint, the ESearch one is built by the query
+    fetch_root: str = Field(
+        default='https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi', frozen=True
     )
 
-    def generate_query(self, query: str) -> str:
-        """
-        URL-encode the search query for use in the E-utilities endpoints.
+    # seconds a search stored on the history server is reused before ESearch is run again
+    history_ttl: float = Field(default=3600.0, gt=0)
 
-        Args:
-            query (str): The search query.
+    _histories: dict[str, History] = PrivateAttr(default_factory=dict)
+    _history_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
 
-        Returns:
-            str: The URL-encoded query string.
+    @singledispatchmethod
+    def search(self) -> ResultPage:
+        raise NotImplementedError
+
+    @search.register
+    def _(
+        self,
+        name: str,
+        include: list,
+        exclude: list | None = None,
+        num_items: int = 10,
+        offset: int = 0,
+        all: bool = False,
+    ) -> ResultPage:
+        query = self.make_query(name, include, exclude or [], num_items, offset)
+        if all:
+            return self.search_all(query)
+        return self.search(query)
+
+    @search.register
+    def _(self, query: PubMedQuery) -> ResultPage:
+        history = self.history(query)
+        try:
+            return self._efetch(query, history)
+        except (HistoryExpiredError, requests.HTTPError) as e:
+            lost = isinstance(e, HistoryExpiredError) or (
+                e.response is not None and e.response.status_code == 400
+            )
+            if not lost:
+                raise
+            logger.warning(f'{self.name}: search session lost ({e}), running ESearch again')
+            return self._efetch(query, self.history(query, stale=history))
+
+    def _efetch(self, query: PubMedQuery, history: History) -> ResultPage:
+        if history.count <= query.start_index:
+            return ResultPage(
+                query=query,
+                total=history.count,
+                items_per_page=query.items_per_page,
+                start_index=query.start_index,
+                items=[],
+            )
+        params = {
+            'db': 'pubmed',
+            'query_key': history.query_key,
+            'WebEnv': history.webenv,
+            'retstart': query.start_index,
+            'retmax': query.items_per_page,
+            'retmode': 'xml',
+        }
+        key = self._page_key(query)
+        logger.info(f'EFetch {query.start_index}-{query.start_index + query.items_per_page}')
+        response = self.fetch(
+            self.fetch_root, params=params, stream=True, query=query, cache_key=key
+        )
+        try:
+            return self._build_results_page(response, query, history.count)
+        except HistoryExpiredError:
+            # the error answer must not be served from the cache
+            if self.cache is not None:
+                self.cache.discard(self.name, key)
+            raise
+
+    def _page_key(self, query: PubMedQuery) -> str:
+        """Cache key of an EFetch page: the search term and range, without the session."""
+        params = {
+            'db': 'pubmed',
+            'term': query.term(),
+            'retstart': query.start_index,
+            'retmax': query.items_per_page,
+            'retmode': 'xml',
+        }
+        return f'{self.fetch_root}?{urlencode(params)}'
+
+    def history(self, query: PubMedQuery, stale: History | None = None) -> History:
+        """
+        Run the ESearch of `query` on the history server, once per search term.
+
+        Pages of the same query fetched concurrently wait for the first one to store the
+        search, then all reuse its WebEnv. The search is stored again once older than
+        `history_ttl`, or when it is the `stale` one a page could not be fetched from. ESearch
+        responses are never served from the cache, the session they point to expires; offline
+        the last one stored gives the number of results.
         """
-        return urllib.parse.quote(query)
+        term = query.term()
+        with self._history_lock:
+            history = self._histories.get(term)
+            if (
+                history is None
+                or history == stale
+                or time.monotonic() - history.created > self.history_ttl
+            ):
+                url = query.page_at(0).model_copy(update={'items_per_page': 0}).generate_url()
+                logger.info(f'Generated query: {url}')
+                result = self.fetch(url, params={'retmode': 'json'}, cached=False)
+                data = result.json()['esearchresult']
+                history = History(
+                    data['webenv'], data['querykey'], int(data['count']), time.monotonic()
+                )
+                self._histories[term] = history
+                print(f'Found {history.count} matches')
+            return history
+
+    def count(self, query: IQuery) -> int:
+        return self.history(query).count  # type: ignore[arg-type]
+
+    def iter_pages(
+        self,
+        query: IQuery,
+        checkpoint: HarvestCheckpoint | None = None,
+        deadline: float | None = None,
+    ) -> Iterator[ResultPage]:
+        batch = max(query.items_per_page, self.batch_size)
+        query = query.model_copy(update={'items_per_page': batch})
+        return super().iter_pages(query, checkpoint, deadline)
+
+    def search_next(self, result_page: ResultPage) -> ResultPage:
+        next_query = result_page.query.page_at(result_page.start_index + result_page.items_per_page)
+        return self.search(next_query)
 
-    def extract_items(self, payload) -> list[Publication]:
+    def extract_items(self, payload, query: IQuery) -> list[Publication]:
         """
-        Extract Publication objects from the JSON payload returned by the ESummary endpoint.
+        Parse a PubMed XML payload (EFetch, `retmode=xml`) into Publication objects.
 
         Args:
-            payload (dict): JSON response from the ESummary endpoint.
+            payload: A readable byte stream with the XML response.
 
         Returns:
             list[Publication]: A list of Publication objects with title, authors, year, and abstract.
         """
-        publications = []
-        # ESummary JSON contains a "result" key with article data, and a "uids" list with PubMed IDs.
-        result = payload.get('result', {})
-        uids = result.get('uids', [])
-        for uid in uids:
-            item = result.get(uid, {})
-            title = item.get('title', 'No Title')
-            # Authors is a list of dictionaries; extract each author's name.
-            authors_list = [author.get('name', '') for author in item.get('authors', [])]
-            # Extract the publication date and derive the year (split by space if necessary)
-            pub_date = item.get('pubdate', '')
-            year = pub_date.split(' ')[0] if pub_date else -1
-            # Abstract is not provided in ESummary; leave as empty string.
-            abstract = ''
-            publications.append(
-                Publication(title=title, authors=authors_list, year=year, abstract=abstract)
-            )
-        return publications
+        return list(self.iter_items(payload, query))
 
-    def search(self, query: str) -> ResultPage:
+    def iter_items(self, source: IO[bytes], query: IQuery) -> Iterator[Publication]:
         """
-        Search PubMed for articles matching the query and return a ResultPage containing Publication items.
+        Incrementally parse a PubmedArticleSet, yielding a Publication as each article closes.
 
-        This method first uses the ESearch endpoint to get PubMed IDs, then retrieves detailed metadata via ESummary.
+        Finished articles are cleared from the tree as soon as they are converted, so a batch
+        of hundreds of records never sits in memory as a whole document.
+        """
+        idx = query.start_index
+        context = ET.iterparse(source, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event == 'end' and elem.tag == 'PubmedArticle':
+                try:
+                    publication = self._build_publication(elem, idx, query)
+                except (AttributeError, TypeError, ValueError) as e:
+                    pmid = elem.findtext('MedlineCitation/PMID')
+                    print(f'[red]Caught![/red] PMID {pmid}: {e}')
+                    logger.warning(f'Skipping PMID {pmid}: {e}')
+                else:
+                    yield publication
+                    idx += 1
+                root.clear()
+        if root.tag == 'eFetchResult':
+            # <eFetchResult><ERROR>...</ERROR>: the WebEnv is no longer on the history server
+            raise HistoryExpiredError(root.findtext('ERROR') or 'EFetch error')
 
-        Args:
-            query (str): The search query.
+    def _build_publication(self, article: ET.Element, idx: int, query: IQuery) -> Publication:
+        citation = article.find('MedlineCitation/Article')
+        if citation is None:
+            raise ValueError('no MedlineCitation/Article')
+        title = ''.join(citation.find('ArticleTitle').itertext())  # type: ignore
 
-        Returns:
-            ResultPage: A page of results with Publication items.
-        """
-        self.log(f'Query: {query}')
-        # URL-encode the query
-        encoded_query = self.generate_query(query)
-        # Call the ESearch endpoint to obtain a list of PubMed IDs
-        esearch_params = {
-            'db': 'pubmed',
-            'term': encoded_query,
-            'retmode': 'json',
-            'retmax': 10,  # Limit to 10 results for this example
-        }
-        esearch_response = requests.get(self.query_root, params=esearch_params)
-        esearch_response.raise_for_status()
-        esearch_data = esearch_response.json()
-        # Extract the list of PubMed IDs from the JSON response
-        id_list = esearch_data.get('esearchresult', {}).get('idlist', [])
-
-        if not id_list:
-            # If no IDs are found, return an empty result page.
-            return ResultPage(query=query, total=0, items_per_page=0, start_index=0, items=[])
-
-        # Join the list of IDs into a comma-separated string for the ESummary query.
-        ids = ','.join(id_list)
-        esummary_params = {'db': 'pubmed', 'id': ids, 'retmode': 'json'}
-        esummary_response = requests.get(self.summary_root, params=esummary_params)
-        esummary_response.raise_for_status()
-        esummary_data = esummary_response.json()
-
-        # Convert the ESummary JSON response into a list of Publication objects.
-        items = self.extract_items(esummary_data)
-        total = len(items)
-
-        self.log(f'Found {total} results')
+        # structured abstracts come as several labelled sections
+        sections = []
+        for text in citation.iterfind('Abstract/AbstractText'):
+            section = ''.join(text.itertext()).strip()
+            label = text.get('Label')
+            sections.append(f'{label}: {section}' if label else section)
+        abstract = '\n'.join(sections)
+
+        authors = []
+        for author in citation.iterfind('AuthorList/Author'):
+            name = author.findtext('CollectiveName') or ' '.join(
+                part for part in (author.findtext('ForeName'), author.findtext('LastName')) if part
+            )
+            if name:
+                authors.append(name)
+
+        published = self._published(citation)
+        doi = article.findtext('PubmedData/ArticleIdList/ArticleId[@IdType="doi"]') or ''
+        return Publication(
+            title=title,
+            authors=authors,
+            year=int(published[:4]) if published else -1,
+            abstract=abstract,
+            published=published,
+            doi=doi,
+            internal_index=idx,
+            provider_name=self.name,
+            query_name=query.name,
+        )
+
+    @staticmethod
+    def _published(citation: ET.Element) -> str:
+        """ISO date (YYYY, YYYY-MM or YYYY-MM-DD) of the journal issue or the electronic article."""
+        date = citation.find('Journal/JournalIssue/PubDate')
+        article_date = citation.find('ArticleDate')
+        if (date is None or date.find('Year') is None) and article_date is not None:
+            date = article_date
+        if date is None:
+            return ''
+        year = date.findtext('Year')
+        if year is None:
+            # free text dates such as "1998 Dec-1999 Jan"
+            medline = date.findtext('MedlineDate') or ''
+            return medline[:4] if medline[:4].isdigit() else ''
+        month = (date.findtext('Month') or '').lower()[:3]
+        month_num = MONTHS.get(month) or (int(month) if month.isdigit() else None)
+        if month_num is None:
+            return year
+        day = date.findtext('Day')
+        if day is None or not day.isdigit():
+            return f'{year}-{month_num:02d}'
+        return f'{year}-{month_num:02d}-{int(day):02d}'
+
+    def _build_results_page(self, response, query: IQuery, total: int = -1) -> ResultPage:
+        with response:
+            papers = list(self.iter_items(self.body_stream(response), query))
+        self.log(f'Fetched {len(papers)} records from {query.start_index}')
         return ResultPage(
             query=query,
             total=total,
-            items_per_page=total,
-            start_index=0,
-            items=items,
+            items_per_page=query.items_per_page,
+            start_index=query.start_index,
+            items=papers,
+            cache_hits=int(getattr(response, 'from_cache', False)),
         )
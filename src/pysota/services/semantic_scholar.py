@@ -1,26 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import singledispatchmethod
+from urllib.parse import quote, quote_plus
 
-import requests
 from loguru import logger
 from pydantic import Field
 from rich import print
 
-from pysota.core import Provider, Publication, ResultPage
+from pysota.core import Provider, Publication, RateLimit, ResultPage
 from pysota.core.query import IQuery
 
+API = 'https://api.semanticscholar.org/graph/v1'
+FIELDS = 'title,year,authors,abstract,url,publicationDate,externalIds'
+
 
 class SemanticScholarQuery(IQuery):
-    base: str = Field(default='https://api.semanticscholar.org/graph/v1/paper/search/bulk')
+    """
+    Query object for the Semantic Scholar Graph API.
+
+    Queries paged by offset use the relevance search (`/paper/search`), which serves the first
+    1000 results at most, `items_per_page` at a time. Queries carrying a cursor use the bulk
+    search (`/paper/search/bulk`), which returns up to 1000 results per call together with the
+    continuation token of the next call; the empty cursor asks for the first call.
+    """
+
+    base: str = Field(default=f'{API}/paper/search')
+    bulk_base: str = Field(default=f'{API}/paper/search/bulk', frozen=True)
 
     def _includes(self) -> str:
-        include_str = '+'.join([term for term in self.include])
-        return include_str
+        return ' '.join(self.include)
 
     def _excludes(self) -> str:
-        if len(self.exclude) == 0:
-            return ''
-        exclude_str = '-'.join(self.exclude)
-        return exclude_str
+        return ''.join(f' -{term}' for term in self.exclude)
 
     def _offset(self) -> str:
         if self.start_index == 0:
@@ -32,17 +42,51 @@ class SemanticScholarQuery(IQuery):
             return ''
         return f'&limit={self.items_per_page}'
 
+    def _dates(self) -> str:
+        if not self.dated:
+            return ''
+        since = self.since.isoformat() if self.since else ''
+        until = self.until.isoformat() if self.until else ''
+        return f'&publicationDateOrYear={since}:{until}'
+
     def generate_url(self) -> str:
-        url = f'{self.base}?query={self._includes()}{self._excludes()}'
-        url += f'{self._offset()}'
-        url += '&fields=title,year,authors,abstract,url'
-        url += '&sort=publicationDate:desc'
+        text = quote_plus(self._includes() + self._excludes())
+        if self.cursor is not None:
+            url = f'{self.bulk_base}?query={text}&fields={FIELDS}{self._dates()}'
+            url += '&sort=publicationDate:desc'
+            if self.cursor:
+                url += f'&token={quote(self.cursor)}'
+        else:
+            url = f'{self.base}?query={text}{self._offset()}{self._limit()}'
+            url += f'&fields={FIELDS}{self._dates()}'
         url += '&openAccessPdf'
         return url
 
 
 class SemanticScholarProvider(Provider):
+    """
+    Provider for querying the Semantic Scholar Graph API.
+
+    Single pages come from the relevance search. Whole result sets (`search_all`, harvests) go
+    through the bulk search, following its continuation tokens 1000 papers at a time. Papers
+    already known by id are fetched with `lookup`, hundreds per request.
+    """
+
+    query_type = SemanticScholarQuery
+    start_cursor = ''
+    bulk_lookup = True
+    # the bulk search returns pages of 1000 papers, whatever the limit
+    harvest_page_size = 1000
+
     name: str = Field(default='semantic', frozen=True)
+    # unauthenticated requests share a pool of roughly one request per second
+    rate_limit: RateLimit = Field(default=RateLimit(rate=1.0, burst=1, max_concurrent=1))
+    # relevance search: offset + limit must stay below 1000
+    max_depth: int | None = Field(default=1000)
+    cursor_paging: bool = Field(default=True)
+    batch_root: str = Field(default=f'{API}/paper/batch', frozen=True)
+    # ids per request to the batch endpoint, which accepts up to 500
+    batch_size: int = Field(default=500, ge=1, le=500)
 
     @singledispatchmethod
     def search(self) -> ResultPage:
@@ -58,70 +102,104 @@ class SemanticScholarProvider(Provider):
         offset: int = 0,
         all: bool = False,
     ) -> ResultPage:
-        query = SemanticScholarQuery(
-            name=name,
-            provider=self.name,
-            include=include,
-            exclude=exclude,
-            items_per_page=num_items,
-            start_index=offset,
-        )
+        query = self.make_query(name, include, exclude, num_items, offset)
+        if all:
+            return self.search_all(query)
         return self.search(query)
 
     @search.register
     def _(self, query: SemanticScholarQuery) -> ResultPage:
         url = query.generate_url()
         logger.info(f'Generated query: {url}')
-        response = requests.get(url)
+        response = self.fetch(url, query=query)
         logger.info(f'response: {response}')
         return self._build_results_page(response, query)
 
+    def harvest_query(self, query: IQuery) -> IQuery:
+        # the relevance search serves at most 100 papers per page, only bulk pages are enlarged
+        harvested = super().harvest_query(query)
+        return harvested if harvested.cursor is not None else query
+
+    def lookup(self, ids: list[str], query_name: str = 'lookup') -> list[Publication | None]:
+        """
+        Fetch papers by id through the batch endpoint, `batch_size` ids per POST.
+
+        Ids are Semantic Scholar paper ids or external ids with their prefix (`DOI:...`,
+        `ARXIV:...`, `PMID:...`). Batches are sent concurrently within the rate limit. The
+        result is aligned with `ids`, with None for the papers the API does not know.
+        """
+
+        def fetch_batch(start: int) -> list[Publication | None]:
+            batch = ids[start : start + self.batch_size]
+            logger.info(f'Batch lookup of {len(batch)} papers')
+            response = self.post(self.batch_root, params={'fields': FIELDS}, json={'ids': batch})
+            return [
+                self._build_publication(entry, start + i, query_name) if entry else None
+                for i, entry in enumerate(response.json())
+            ]
+
+        starts = range(0, len(ids), self.batch_size)
+        with ThreadPoolExecutor(
+            max_workers=self.rate_limit.max_concurrent, thread_name_prefix='pysota-semantic'
+        ) as pool:
+            batches = list(pool.map(fetch_batch, starts))
+        return [paper for batch in batches for paper in batch]
+
+    def lookup_abstracts(self, dois: list[str], titles: list[str]) -> dict[str, str]:
+        # the batch endpoint takes DOIs but not titles
+        papers = self.lookup([f'DOI:{doi}' for doi in dois])
+        return {
+            doi.lower(): paper.abstract
+            for doi, paper in zip(dois, papers)
+            if paper is not None and paper.abstract
+        }
+
     def extract_items(self, payload, query: IQuery) -> list[Publication]:
         papers = []
         idx = query.start_index
-        data = payload.json()['data']
-        for entry in data:
-            try:
-                authors = []
-                for author in entry.get('authors', ''):
-                    name = author.get('name', '')
-                    authors.append(name)
-                title = entry.get('title', '')
-                abstract = entry.get('abstract', '')
-                year = entry.get('year', 0000)
-
-                pub = Publication(
-                    title=title,
-                    authors=authors,
-                    year=year,
-                    abstract=abstract,
-                    internal_index=idx,
-                    provider_name=self.name,
-                    query_name=query.name,
-                )
-                papers.append(pub)
+        for entry in payload.get('data') or []:
+            paper = self._build_publication(entry, idx, query.name)
+            if paper is not None:
+                papers.append(paper)
                 idx += 1
-            except Exception as e:
-                logger.warning(f'Error processing data:\n{e}')
-                continue
         return papers
 
+    def _build_publication(self, entry: dict, idx: int, query_name: str) -> Publication | None:
+        try:
+            authors = [author.get('name', '') for author in entry.get('authors') or []]
+            return Publication(
+                title=entry.get('title') or '',
+                authors=authors,
+                year=entry.get('year') or 0,
+                abstract=entry.get('abstract') or '',
+                published=entry.get('publicationDate') or '',
+                doi=(entry.get('externalIds') or {}).get('DOI') or '',
+                internal_index=idx,
+                provider_name=self.name,
+                query_name=query_name,
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning(f'Error processing data:\n{e}')
+            return None
+
     def search_next(self, result_page: ResultPage) -> ResultPage:
-        raise NotImplementedError
+        next_query = result_page.query.page_at(
+            result_page.start_index + result_page.items_per_page, result_page.next_cursor
+        )
+        return self.search(next_query)
 
     def _build_results_page(self, response, query: SemanticScholarQuery) -> ResultPage:
-        try:
-            total = response.json()['total']
-            papers = self.extract_items(response, query)
-            print(f'Found {total} matches')
-            logger.info(f'Found {total} matches')
-            res = ResultPage(
-                query=query,
-                total=total,
-                items_per_page=query.items_per_page,
-                start_index=query.start_index,
-                items=papers,
-            )
-            return res
-        except:
-            print(response.json())
+        payload = response.json()
+        total = payload.get('total', -1)
+        papers = self.extract_items(payload, query)
+        print(f'Found {total} matches')
+        logger.info(f'Found {total} matches')
+        return ResultPage(
+            query=query,
+            total=total,
+            items_per_page=query.items_per_page,
+            start_index=query.start_index,
+            items=papers,
+            cache_hits=int(getattr(response, 'from_cache', False)),
+            next_cursor=payload.get('token') if query.cursor is not None else None,
+        )